@@ -42,8 +42,7 @@ password = WebDriverWait(driver, 3).until(
         )
 
 username.send_keys(usr)
-#password.send_keys(pwd)
-password.send_keys("2/2*2Hijosmemsam")
+password.send_keys(pwd)
 password.send_keys(Keys.RETURN)
 sleep(1)
 
@@ -29,8 +29,7 @@ def login(driver, username, password, second_factor):
     driver.get("https://virtual.upb.edu.co/d2l/login?noRedirect=1")
 
     WebDriverWait(driver, 10).until(EC.presence_of_element_located((By.ID, "userName"))).send_keys(username)
-    #WebDriverWait(driver, 10).until(EC.presence_of_element_located((By.ID, "password"))).send_keys(password + Keys.RETURN)
-    WebDriverWait(driver, 10).until(EC.presence_of_element_located((By.ID, "password"))).send_keys("2/2*2Hijosmemsam" + Keys.RETURN)
+    WebDriverWait(driver, 10).until(EC.presence_of_element_located((By.ID, "password"))).send_keys(password + Keys.RETURN)
     sleep(1)
 
     # Autenticación de dos factores
@@ -1,7 +1,14 @@
 import re
 import pandas as pd
 import os, gc   
-from time import sleep
+import json, time
+import ctypes
+import threading
+import asyncio
+import urllib.request, urllib.error
+from html.parser import HTMLParser
+from queue import Queue, Empty
+from concurrent.futures import ThreadPoolExecutor
 from getpass import getpass
 from selenium import webdriver
 from selenium.webdriver.common.by import By
@@ -10,6 +17,21 @@ from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.chrome.options import Options
+from selenium.common.exceptions import NoSuchElementException, StaleElementReferenceException
+from helperscomunV2 import CONFIG
+
+# Dominio de Brightspace; todas las URL del bot se arman sobre esta base (brightspace_base_url permite apuntar a otro servidor)
+BASE_URL = CONFIG.get('brightspace_base_url', "https://virtual.upb.edu.co").rstrip('/')
+
+# Sincronización con la página: intervalo de sondeo y tiempo máximo (segundos) de cada paso
+POLL_FREQUENCY = 0.1
+TIMEOUT_LOGIN = 20
+TIMEOUT_2FA = 30
+TIMEOUT_CURSO = 15
+
+# Backend HTTP: respuestas que se reintentan y espera base (segundos) del backoff exponencial
+ESTADOS_REINTENTO_HTTP = {429, 500, 502, 503, 504}
+BACKOFF_HTTP = 0.5
 
 #configura el driver de selenium
 def setup_driver():
@@ -40,27 +62,128 @@ def setup_driver():
     # -------------------------------------------------------------
 
     driver = webdriver.Chrome(service=service, options=options)
-    driver.implicitly_wait(10)
+    driver.implicitly_wait(0)  # Solo esperas explícitas (wait_for); la implícita se suma a cada sondeo
     
     return driver
 
+#espera explícita: sondea la condición cada POLL_FREQUENCY segundos hasta que se cumpla o venza el timeout
+def wait_for(driver, timeout, condition):
+    """Retorna el valor de la condición apenas se cumple; lanza TimeoutException si vence el tiempo del paso"""
+    return WebDriverWait(driver, timeout, poll_frequency=POLL_FREQUENCY,
+                         ignored_exceptions=(NoSuchElementException, StaleElementReferenceException)).until(condition)
+
+#condición: el campo existe y ya tiene un valor no vacío (la página terminó de llenarlo)
+def field_has_value(locator):
+    """Condición para wait_for: retorna el valor del campo, o False mientras esté vacío"""
+    def condition(driver):
+        value = driver.find_element(*locator).get_attribute('value')
+        return value if value else False
+    return condition
+
 #login con credenciales y clave 2FA
 def login(driver, username, password, second_factor):
     """Realiza login con credenciales y clave 2FA"""
-    driver.get("https://virtual.upb.edu.co/d2l/login?noRedirect=1")
+    driver.get(f"{BASE_URL}/d2l/login?noRedirect=1")
 
-    WebDriverWait(driver, 10).until(EC.presence_of_element_located((By.ID, "userName"))).send_keys(username)
-    #WebDriverWait(driver, 10).until(EC.presence_of_element_located((By.ID, "password"))).send_keys(password + Keys.RETURN)
-    WebDriverWait(driver, 10).until(EC.presence_of_element_located((By.ID, "password"))).send_keys("2/2*2Hijosmemsam" + Keys.RETURN)
-    sleep(1)
+    wait_for(driver, TIMEOUT_LOGIN, EC.presence_of_element_located((By.ID, "userName"))).send_keys(username)
+    login_url = driver.current_url
+    wait_for(driver, TIMEOUT_LOGIN, EC.presence_of_element_located((By.ID, "password"))).send_keys(password + Keys.RETURN)
+    # El login se procesó cuando el navegador sale de la página de login
+    wait_for(driver, TIMEOUT_LOGIN, EC.url_changes(login_url))
 
     # Autenticación de dos factores
-    driver.get("https://virtual.upb.edu.co/d2l/lp/auth/twofactorauthentication/TwoFactorCodeEntry.d2l")
+    driver.get(f"{BASE_URL}/d2l/lp/auth/twofactorauthentication/TwoFactorCodeEntry.d2l")
     #WebDriverWait(driver, 10).until(EC.presence_of_element_located((By.ID, "z_d"))).send_keys(second_factor + Keys.RETURN) //codigo anterior
-    WebDriverWait(driver, 10).until(EC.presence_of_element_located((By.ID, "z_i"))).send_keys(second_factor + Keys.RETURN)
+    two_factor_url = driver.current_url
+    wait_for(driver, TIMEOUT_2FA, EC.element_to_be_clickable((By.ID, "z_i"))).send_keys(second_factor + Keys.RETURN)
 
     # Esperar hasta que se redireccione al home de la plataforma para asegurar que el login se complete
-    sleep(3)
+    wait_for(driver, TIMEOUT_2FA, EC.url_changes(two_factor_url))
+
+#la sesión no es válida cuando Brightspace redirige a la página de login
+def is_login_redirect(driver):
+    """True si el navegador quedó en /d2l/login (sesión vencida o inexistente)"""
+    return '/d2l/login' in driver.current_url
+
+#carga cookies en el navegador
+def add_cookies(driver, cookies):
+    """Agrega las cookies a la sesión del navegador (solo se pueden agregar estando en el dominio de Brightspace)"""
+    driver.get(f"{BASE_URL}/d2l/login?noRedirect=1")
+    for cookie in cookies:
+        driver.add_cookie(cookie)
+
+#abre una sesión adicional del navegador reutilizando las cookies del login principal
+def clone_session(driver):
+    """Abre otro navegador con las cookies de la sesión autenticada (no repite credenciales ni 2FA)"""
+    clone = setup_driver()
+    add_cookies(clone, driver.get_cookies())
+    return clone
+
+#DPAPI de Windows (CryptProtectData/CryptUnprotectData): cifra con la llave del usuario de Windows
+class _DataBlob(ctypes.Structure):
+    _fields_ = [('cbData', ctypes.c_ulong), ('pbData', ctypes.POINTER(ctypes.c_char))]
+
+def _dpapi(data, protect):
+    """Cifra (protect=True) o descifra bytes con DPAPI; lanza OSError si Windows rechaza la operación"""
+    buffer = ctypes.create_string_buffer(data, len(data))
+    blob_in = _DataBlob(len(data), ctypes.cast(buffer, ctypes.POINTER(ctypes.c_char)))
+    blob_out = _DataBlob()
+    crypt32 = ctypes.windll.crypt32
+    function = crypt32.CryptProtectData if protect else crypt32.CryptUnprotectData
+    # CRYPTPROTECT_UI_FORBIDDEN = 0x1: nunca mostrar diálogos
+    if not function(ctypes.byref(blob_in), None, None, None, None, 0x1, ctypes.byref(blob_out)):
+        raise ctypes.WinError()
+    try:
+        return ctypes.string_at(blob_out.pbData, blob_out.cbData)
+    finally:
+        ctypes.windll.kernel32.LocalFree(blob_out.pbData)
+
+#protege el contenido del archivo de sesión: DPAPI en Windows (los bits de permisos no restringen el acceso ahí)
+_USAR_DPAPI = os.name == 'nt'
+
+def _protect_session(data):
+    return _dpapi(data, True) if _USAR_DPAPI else data
+
+def _unprotect_session(data):
+    return _dpapi(data, False) if _USAR_DPAPI else data
+
+#guarda las cookies de la sesión autenticada para reutilizarlas en la siguiente ejecución
+def save_session(file_path, driver):
+    """Escribe las cookies cifradas con DPAPI en Windows, o en un archivo con permisos 0o600 en Linux/macOS;
+    vía .tmp y reemplazo"""
+    data = {'guardado': time.time(), 'cookies': driver.get_cookies()}
+    contenido = _protect_session(json.dumps(data).encode('utf-8'))
+    temporal = file_path + '.tmp'
+    fd = os.open(temporal, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'wb') as f:
+        f.write(contenido)
+    os.replace(temporal, file_path)
+
+#lee la sesión guardada, descartando lo vencido
+def load_session(file_path, max_horas):
+    """Retorna las cookies vigentes; None si no hay sesión guardada, es más antigua que max_horas o todas expiraron"""
+    if not os.path.exists(file_path):
+        return None
+    try:
+        with open(file_path, 'rb') as f:
+            data = json.loads(_unprotect_session(f.read()).decode('utf-8'))
+    except (OSError, ValueError) as e:
+        print(f"[Advertencia] No se pudo leer la sesión guardada {file_path}: {e}")
+        return None
+
+    ahora = time.time()
+    if ahora - data.get('guardado', 0) > max_horas * 3600:
+        return None
+    # Las cookies de sesión (sin 'expiry') se conservan; su validez la decide el servidor
+    cookies = [cookie for cookie in data.get('cookies', []) if cookie.get('expiry') is None or cookie['expiry'] > ahora]
+    return cookies or None
+
+#restaura la sesión guardada en el navegador
+def restore_session(driver, cookies):
+    """Carga las cookies y abre el home; la sesión es válida si Brightspace no redirige a /d2l/login"""
+    add_cookies(driver, cookies)
+    driver.get(f"{BASE_URL}/d2l/home")
+    return not is_login_redirect(driver)
 
 #extrae el ID del curso desde la URL usando expresiones regulares
 def get_course_id(url):
@@ -71,16 +194,15 @@ def get_course_id(url):
 #extrae el shortname del curso 
 def get_shortname(driver, course_id, error_log):
     """Navega a la página del curso y extrae el shortname si está disponible"""
-    url = f'https://virtual.upb.edu.co/d2l/lp/manageCourses/course_offering_info_viewedit.d2l?ou={course_id}'
+    url = f'{BASE_URL}/d2l/lp/manageCourses/course_offering_info_viewedit.d2l?ou={course_id}'
     try:
         driver.get(url)
-        sleep(1)  # Espera para que la página cargue completamente
+        if is_login_redirect(driver):
+            # Sin esperar al timeout: la sesión venció durante la ejecución
+            raise RuntimeError("Sesión vencida: Brightspace redirigió a /d2l/login")
 
-        shortname_field = WebDriverWait(driver, 10).until(
-            EC.presence_of_element_located((By.ID, "z_l"))
-        )
-        sleep(1)  # Espera para que la página cargue completamente
-        return shortname_field.get_attribute('value')
+        # Se espera al Código de oferta de curso (z_l) con valor, no un tiempo fijo
+        return wait_for(driver, TIMEOUT_CURSO, field_has_value((By.ID, "z_l")))
 
     except Exception as e:
         print(f"[Error] No se pudo acceder o encontrar el campo Código de oferta de curso para el ID {course_id}")
@@ -91,6 +213,157 @@ def get_shortname(driver, course_id, error_log):
         })
         return None
 
+#extrae el valor de un input (por id) del HTML de la página, sin navegador
+class _InputValueParser(HTMLParser):
+    """Guarda el atributo value del primer <input> con el id buscado"""
+    def __init__(self, field_id):
+        super().__init__()
+        self.field_id = field_id
+        self.value = None
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'input' and self.value is None:
+            attrs = dict(attrs)
+            if attrs.get('id') == self.field_id:
+                self.value = attrs.get('value') or ''
+
+def parse_shortname_html(html):
+    """Retorna el Código de oferta de curso (campo z_l) de course_offering_info_viewedit.d2l, o None si no está"""
+    parser = _InputValueParser("z_l")
+    parser.feed(html)
+    return parser.value
+
+#valida la sesión guardada sin navegador: es válida si /d2l/home no redirige a /d2l/login
+def session_valid_http(cookies):
+    """Consulta el home con las cookies de la sesión guardada"""
+    request = urllib.request.Request(f"{BASE_URL}/d2l/home",
+                                     headers={'Cookie': '; '.join(f"{c['name']}={c['value']}" for c in cookies)})
+    try:
+        with urllib.request.urlopen(request, timeout=TIMEOUT_LOGIN) as response:
+            return '/d2l/login' not in response.geturl()
+    except (urllib.error.URLError, OSError):
+        return False
+
+#backend HTTP: resuelve los shortnames sin navegador, con las cookies de la sesión autenticada
+def resolve_shortnames_http(cookies, course_ids, journal=None):
+    """Equivalente a resolve_shortnames con un cliente HTTP asíncrono (aiohttp): pool de conexiones,
+    concurrencia acotada y reintentos con backoff. Retorna ({course_id: shortname}, errores) en el orden de course_ids"""
+    try:
+        import aiohttp  # Dependencia opcional: solo se requiere con shortname_backend = "http"
+    except ImportError:
+        raise ImportError('shortname_backend = "http" requiere el paquete aiohttp (pip install aiohttp)') from None
+
+    concurrencia = max(1, int(CONFIG.get('shortname_http_concurrencia', 16)))
+    reintentos = max(0, int(CONFIG.get('shortname_http_reintentos', 3)))
+    api_version = CONFIG.get('shortname_api_version')
+
+    async def consultar(session, url):
+        """Una petición: Code del API Valence (si hay shortname_api_version) o el campo z_l de la página"""
+        async with session.get(url) as response:
+            if '/d2l/login' in str(response.url):
+                raise RuntimeError("Sesión vencida: Brightspace redirigió a /d2l/login")
+            response.raise_for_status()
+            if api_version:
+                short_name = (await response.json(content_type=None)).get('Code')
+            else:
+                short_name = parse_shortname_html(await response.text())
+
+        if not short_name:
+            raise ValueError("La respuesta no trae el Código de oferta de curso")
+        return short_name
+
+    async def resolver_curso(session, semaforo, course_id, error_log):
+        if api_version:
+            url = f"{BASE_URL}/d2l/api/lp/{api_version}/courses/{course_id}"
+        else:
+            url = f"{BASE_URL}/d2l/lp/manageCourses/course_offering_info_viewedit.d2l?ou={course_id}"
+
+        async with semaforo:
+            print(f"\nProcesando curso ID: {course_id}")
+            for intento in range(reintentos + 1):
+                try:
+                    return await consultar(session, url)
+                except Exception as e:
+                    reintentable = (isinstance(e, (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError, asyncio.TimeoutError))
+                                    or (isinstance(e, aiohttp.ClientResponseError) and e.status in ESTADOS_REINTENTO_HTTP))
+                    if reintentable and intento < reintentos:
+                        await asyncio.sleep(BACKOFF_HTTP * 2 ** intento)
+                        continue
+
+                    print(f"[Error] No se pudo obtener el Código de oferta de curso para el ID {course_id}")
+                    error_log.append({
+                        'course_id': course_id,
+                        'url': url,
+                        'error': str(e) or type(e).__name__
+                    })
+                    return None
+
+    async def resolver_y_registrar(session, semaforo, course_id, error_log):
+        short_name = await resolver_curso(session, semaforo, course_id, error_log)
+        if journal is not None:
+            # La escritura + fsync bloquea: se hace en un hilo para no detener las demás peticiones
+            await asyncio.get_running_loop().run_in_executor(None, journal.record, course_id, short_name, error_log)
+        return short_name
+
+    async def resolver():
+        semaforo = asyncio.Semaphore(concurrencia)
+        connector = aiohttp.TCPConnector(limit=concurrencia)
+        timeout = aiohttp.ClientTimeout(total=TIMEOUT_CURSO)
+        errores_por_curso = {course_id: [] for course_id in course_ids}
+        async with aiohttp.ClientSession(cookies={c['name']: c['value'] for c in cookies},
+                                         connector=connector, timeout=timeout) as session:
+            resultados = await asyncio.gather(*(resolver_y_registrar(session, semaforo, course_id, errores_por_curso[course_id])
+                                                for course_id in course_ids))
+        return resultados, errores_por_curso
+
+    resultados, errores_por_curso = asyncio.run(resolver())
+    shortnames = {course_id: short_name for course_id, short_name in zip(course_ids, resultados) if short_name}
+    errores = [error for course_id in course_ids for error in errores_por_curso[course_id]]
+    return shortnames, errores
+
+#resuelve los shortnames con un pool de sesiones; cada sesión toma ID de curso de una cola compartida
+def resolve_shortnames(sessions, course_ids, fetch=get_shortname, journal=None):
+    """Devuelve ({course_id: shortname}, errores) en el orden de course_ids, sin importar qué sesión resolvió cada curso.
+    fetch(session, course_id, error_log) es la capa de consulta (por defecto get_shortname con Selenium);
+    si hay journal, cada curso queda registrado en disco apenas se resuelve"""
+    cola = Queue()
+    for course_id in course_ids:
+        cola.put(course_id)
+
+    resultados = {}
+    errores_por_curso = {}
+
+    def trabajar(session):
+        while True:
+            try:
+                course_id = cola.get_nowait()
+            except Empty:
+                return
+            print(f"\nProcesando curso ID: {course_id}")
+            error_log = []
+            resultados[course_id] = fetch(session, course_id, error_log)
+            errores_por_curso[course_id] = error_log
+            if journal is not None:
+                journal.record(course_id, resultados[course_id], error_log)
+
+    with ThreadPoolExecutor(max_workers=len(sessions)) as executor:
+        list(executor.map(trabajar, sessions))
+
+    shortnames = {course_id: resultados[course_id] for course_id in course_ids if resultados.get(course_id)}
+    errores = [error for course_id in course_ids for error in errores_por_curso.get(course_id, [])]
+    return shortnames, errores
+
+#login interactivo (credenciales + 2FA) y se guarda la sesión para las siguientes ejecuciones
+def authenticate(driver, session_file):
+    """Pide credenciales y clave 2FA, hace login en el navegador y guarda las cookies"""
+    # --- Recolección de credenciales ---
+    user = input('Username: ')
+    password = getpass('Password: ')
+    second_factor = input("Clave 2FA: ")
+
+    login(driver, user, password, second_factor)
+    save_session(session_file, driver)
+
 #valida si el curso ya existe en el archivo shortnames.csv
 def load_existing_shortnames(file_path):
     """Carga datos previos si el archivo existe, para evitar duplicados"""
@@ -98,58 +371,211 @@ def load_existing_shortnames(file_path):
         return pd.read_csv(file_path)
     return pd.DataFrame(columns=['Nombre', 'NRC'])
 
+#lee ListaCursos.csv y devuelve los ID de curso sin repetir, en el orden de la lista
+def read_course_ids(file_path, errores):
+    """Extrae el ID de cada URL; las URL sin ID van a errores y los ID repetidos se procesan una sola vez"""
+    df_urls = pd.read_csv(file_path)
+    course_urls = df_urls['Enlace curso'].dropna() # Asegurarse de que no haya valores nulos
+
+    course_ids = []
+    vistos = set()
+    for url in course_urls:
+        course_id = get_course_id(url)
+        if not course_id:
+            print(f"[Advertencia] No se pudo extraer ID del curso desde URL: {url}")
+            errores.append({
+                'course_id': 'N/A',
+                'url': url,
+                'error': 'No se pudo extraer el ID del curso'
+            })
+            continue
+        if course_id in vistos:
+            continue
+        vistos.add(course_id)
+        course_ids.append(course_id)
+    return course_ids
+
+#journal de escritura anticipada: cada curso resuelto queda en disco apenas termina (tolera caídas del navegador o de la sesión)
+class ShortnameJournal:
+    """Archivo JSON Lines de solo agregado; cada registro se escribe con flush + fsync.
+    Al terminar la ejecución se compacta en el cache/shortnames.csv y se elimina"""
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self._lock = threading.Lock()  # Las sesiones del pool registran desde varios hilos
+        self._file = None
+
+    def load(self):
+        """Retorna {course_id: shortname} de los cursos ya resueltos en una ejecución interrumpida"""
+        shortnames = {}
+        if not os.path.exists(self.file_path):
+            return shortnames
+        with open(self.file_path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    registro = json.loads(line)
+                except ValueError:
+                    continue  # Última línea cortada por la caída
+                if registro.get('shortname'):
+                    shortnames[registro['course_id']] = registro['shortname']
+        return shortnames
+
+    def record(self, course_id, short_name, error_log):
+        """Agrega el resultado del curso (shortname o errores) y lo fuerza a disco"""
+        line = json.dumps({'course_id': course_id, 'shortname': short_name, 'errores': error_log}, ensure_ascii=False)
+        with self._lock:
+            if self._file is None:
+                self._file = open(self.file_path, 'a', encoding='utf-8')
+            self._file.write(line + '\n')
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def close(self, remove=False):
+        """Cierra el journal; remove=True lo elimina (su contenido ya quedó compactado)"""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+        if remove and os.path.exists(self.file_path):
+            os.remove(self.file_path)
+
+#export de unidades organizacionales de Brightspace (OrgUnitId, Code, Name, Type) -> índice OrgUnitId -> Code
+def load_orgunit_export(file_path):
+    """Lee el export (.csv o .xlsx) solo con OrgUnitId y Code; vacío si no se puede leer.
+    Los OrgUnitId son únicos entre tipos de unidad, así que no se filtra por Type"""
+    columnas = ['OrgUnitId', 'Code']
+    try:
+        if file_path.lower().endswith('.csv'):
+            df = pd.read_csv(file_path, usecols=columnas, dtype=str, encoding='utf-8-sig')
+        else:
+            df = pd.read_excel(file_path, usecols=columnas, dtype=str)
+    except Exception as e:
+        print(f"[Advertencia] No se pudo leer el export de unidades organizacionales {file_path}: {e}")
+        return {}
+
+    df = df.dropna(subset=columnas)
+    org_unit_ids = df['OrgUnitId'].str.strip().str.replace(r'\.0$', '', regex=True)
+    index = dict(zip(org_unit_ids, df['Code'].str.strip()))
+    print(f"[Info] Export de unidades organizacionales cargado con {len(index)} unidades: {file_path}")
+    return index
+
+#cache persistente ID de curso -> shortname (se consulta antes de abrir el navegador)
+def load_shortname_cache(file_path):
+    """Carga el cache course_id -> shortname; vacío si el archivo no existe"""
+    if not os.path.exists(file_path):
+        return {}
+    df = pd.read_csv(file_path, dtype=str).dropna()
+    return dict(zip(df['course_id'], df['shortname']))
+
+def save_shortname_cache(file_path, cache):
+    """Guarda el cache completo (escritura a un .tmp y reemplazo, para no dejarlo a medias)"""
+    temporal = file_path + '.tmp'
+    pd.DataFrame(list(cache.items()), columns=['course_id', 'shortname']).to_csv(temporal, index=False)
+    os.replace(temporal, file_path)
+
+#valida el shortname (Nombre-...-Periodo-NRC) y lo agrega a los cursos nuevos si no estaba registrado
+def add_shortname(short_name, existing_names, new_course_data):
+    if short_name not in existing_names:
+        #Se extrae el periodo y NRC/LC
+        partes = short_name.split('-')
+        if len(partes) == 4:
+            Periodo = partes[-2]
+            NRC_LC = partes[-1]
+            
+            new_course_data.append((short_name, NRC_LC, Periodo))
+            existing_names.add(short_name)
+        else:
+            print(f"[Advertencia] EL codigo del curso tiene errores: {short_name}")
+    else:
+        print(f"[Info] Curso ya registrado previamente: {short_name}")
+
 
 def main():
-    # --- Recolección de credenciales ---
-    user = input('Username: ')
-    password = getpass('Password: ')
-    second_factor = input("Clave 2FA: ")
+    errores = []  # Lista de errores
+
+    # --- Lectura de URLs desde CSV (un ID de curso por URL, sin repetidos) ---
+    course_ids = read_course_ids('ListaCursos.csv', errores)
+
+    # --- Cache de shortnames: solo los ID que no están en el cache pasan por el navegador ---
+    cache_file = CONFIG.get('shortname_cache_file', 'shortname_cache.csv')
+    cache = load_shortname_cache(cache_file)
 
-    # --- Configuración del navegador ---
-    driver = setup_driver()
+    # --- Journal: con shortname_reanudar se saltan los cursos resueltos en una ejecución interrumpida ---
+    journal = ShortnameJournal(CONFIG.get('shortname_journal_file', 'shortname_journal.jsonl'))
+    if CONFIG.get('shortname_reanudar', True):
+        journaled = journal.load()
+        if journaled:
+            print(f"[Info] Reanudando ejecución interrumpida: {len(journaled)} cursos ya resueltos en {journal.file_path}")
+            cache.update(journaled)
+    else:
+        journal.close(remove=True)
 
+    pendientes = [course_id for course_id in course_ids if course_id not in cache]
+
+    # --- Export de unidades organizacionales (opcional): resuelve sin navegador los ID que no están en el cache ---
+    export_file = CONFIG.get('orgunits_export_file')
+    en_export = 0
+    if export_file and pendientes:
+        export = load_orgunit_export(export_file)
+        for course_id in pendientes:
+            if export.get(course_id):
+                cache[course_id] = export[course_id]
+                en_export += 1
+        pendientes = [course_id for course_id in pendientes if course_id not in cache]
+        del export
+
+    print(f"[Info] {len(course_ids)} cursos en la lista: {len(course_ids) - len(pendientes) - en_export} en cache, "
+          f"{en_export} en el export, {len(pendientes)} por consultar.")
+
+    sessions = []
+    completado = False
     try:
-        login(driver, user, password, second_factor)
- 
-        # --- Lectura de URLs desde CSV ---
-        df_urls = pd.read_csv('ListaCursos.csv')
-        course_urls = df_urls['Enlace curso'].dropna() # Asegurarse de que no haya valores nulos
+        if pendientes:
+            # --- Sesión guardada: solo se pide login y 2FA si no hay sesión o Brightspace redirige a /d2l/login ---
+            session_file = CONFIG.get('shortname_session_file', 'shortname_session.json')
+            cookies = load_session(session_file, float(CONFIG.get('shortname_session_max_horas', 12)))
+
+            if CONFIG.get('shortname_backend', 'selenium') == 'http':
+                # --- Backend HTTP: el navegador solo se abre si hay que hacer login ---
+                if cookies and session_valid_http(cookies):
+                    print("[Info] Sesión guardada vigente: se omite login y 2FA.")
+                else:
+                    driver = setup_driver()
+                    sessions.append(driver)
+                    authenticate(driver, session_file)
+                    cookies = driver.get_cookies()
+                print(f"[Info] Consultando {len(pendientes)} cursos por HTTP.")
+
+                shortnames, errores_consulta = resolve_shortnames_http(cookies, pendientes, journal=journal)
+            else:
+                # --- Configuración del navegador: sesión principal y copias para el resto del pool ---
+                driver = setup_driver()
+                sessions.append(driver)
+
+                if cookies and restore_session(driver, cookies):
+                    print("[Info] Sesión guardada vigente: se omite login y 2FA.")
+                else:
+                    authenticate(driver, session_file)
+
+                workers = max(1, min(int(CONFIG.get('shortname_workers', 1)), len(pendientes)))
+                for _ in range(workers - 1):
+                    sessions.append(clone_session(driver))
+                print(f"[Info] Consultando {len(pendientes)} cursos con {len(sessions)} sesion(es) del navegador.")
+
+                shortnames, errores_consulta = resolve_shortnames(sessions, pendientes, journal=journal)
+
+            cache.update(shortnames)
+            errores.extend(errores_consulta)
 
         output_file = 'shortnames.csv'
         existing_data = load_existing_shortnames(output_file)
         existing_names = set(existing_data['Nombre'])
 
+        # Se recorren los cursos en el orden de la lista, con el shortname del cache o el recién consultado
         new_course_data = []
-        errores = []  # Lista de errores
-
-        for url in course_urls:
-            course_id = get_course_id(url)
-            if not course_id:
-                print(f"[Advertencia] No se pudo extraer ID del curso desde URL: {url}")
-                errores.append({
-                    'course_id': 'N/A',
-                    'url': url,
-                    'error': 'No se pudo extraer el ID del curso'
-                })
-                continue
-
-            print(f"\nProcesando curso ID: {course_id}")
-            short_name = get_shortname(driver, course_id, errores)
-
-            if short_name and short_name not in existing_names:
-                #Se extrae el periodo y NRC/LC
-                partes = short_name.split('-')
-                if len(partes) == 4:
-                    Periodo = partes[-2]
-                    NRC_LC = partes[-1]
-                    
-                    new_course_data.append((short_name, NRC_LC, Periodo))
-                    existing_names.add(short_name)
-                else:
-                    print(f"[Advertencia] EL codigo del curso tiene errores: {short_name}")
-
-            elif short_name:
-                print(f"[Info] Curso ya registrado previamente: {short_name}")
+        for course_id in course_ids:
+            short_name = cache.get(course_id)
+            if short_name:
+                add_shortname(short_name, existing_names, new_course_data)
 
         # Guardar resultados exitosos
         if new_course_data:
@@ -166,8 +592,16 @@ def main():
             df_errores.to_csv('errores.csv', index=False)
             print(f"\n[!] Se encontraron errores. Ver detalle en errores.csv")
 
+        completado = True
+
     finally:
-        driver.quit()
+        # El cache se guarda aunque el proceso falle a mitad de camino
+        if cache:
+            save_shortname_cache(cache_file, cache)
+        # Compactación: si la ejecución terminó, el journal ya está en el cache y en shortnames.csv
+        journal.close(remove=completado)
+        for session in sessions:
+            session.quit()
         gc.collect()                             # Limpieza de memoria
         print("\n[✓] Proceso finalizado.")
 
@@ -0,0 +1,1208 @@
+#!/usr/bin/python
+import json
+import csv
+import hashlib
+import pickle
+import time
+import numpy as np
+import pandas as pd
+import os
+import gzip
+import shutil
+import tempfile
+import posixpath
+import zipfile
+import xml.etree.ElementTree as ET
+from datetime import datetime
+from itertools import repeat
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from openpyxl import load_workbook
+from openpyxl.cell.cell import ERROR_CODES
+from pandas.io.parsers import TextParser
+
+# Estructuras y funciones compartidas por los flujos de estudiantes (helpersestV2) y docentes (helpersmodV2).
+
+# Cargar configuración desde JSON - directorio es (opcional). Si no existe, se usan valores por defecto.
+def load_config(path="config.json"):
+    """
+    Intenta cargar el archivo JSON de configuración ubicado en el directorio del script.
+    Devuelve un dict con la configuración (vacío si no existe o hay errores).
+    """
+    try:
+        base = os.path.dirname(os.path.abspath(__file__))
+    except NameError:
+        base = os.getcwd()
+
+    cfg_path = os.path.join(base, path)
+    if not os.path.isfile(cfg_path):
+        # No hay archivo de configuración, devolvemos dict vacío
+        return {}
+
+    try:
+        with open(cfg_path, encoding="utf8") as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"[WARN] Error al leer la configuración {cfg_path}: {e}")
+        return {}
+
+# Cargar la configuración global una sola vez
+CONFIG = load_config()
+
+# Resuelve rutas relativas respecto a la carpeta del script
+def _resolve_path(path_value, default_path):
+    base = os.path.dirname(os.path.abspath(__file__))
+    final_path = path_value if path_value else default_path
+    if not os.path.isabs(final_path):
+        final_path = os.path.join(base, final_path)
+    return final_path
+
+
+# Rol de arquetipo (OrgRoleId en BDUsuarios) -> Unidad organizacional de arquetipo
+# (en docentes es la unidad de la que se desmatricula al docente)
+MAPEO_ROLES_ARQUETIPO = pd.DataFrame(
+    [('150', 'CVTE'), ('143', 'CVLA'), ('138', 'CVPR'), ('137', 'CVFC'), ('136', 'CVFA'), ('135', 'CVFA')],
+    columns=['OrgRoleId', 'OrgUnidArquetipo']
+)
+
+# Unidad de arquetipo -> rol de estudiante (mismo criterio de helpersestV2.rol_formacion)
+ROL_POR_ARQUETIPO = {'CVTE': 'Student_te', 'CVLA': 'Student_ap', 'CVPR': 'Student_pr', 'CVFC': 'Student_ex', 'CVFA': 'Student_fa'}
+
+#OrgRoleId (texto) -> nombre del rol: roles de estudiante del mapeo de arquetipos + "roles_org_ids" de la configuración
+def mapa_roles_org():
+    """
+    Los roles Student_* se derivan de MAPEO_ROLES_ARQUETIPO. Los demás (ej: Moderador) se toman de
+    la llave "roles_org_ids" del config.json, {"Moderador": 110} o {"Moderador": [110, 111]},
+    que también puede reemplazar un OrgRoleId del mapeo.
+    """
+    mapa = {org_id: ROL_POR_ARQUETIPO[unidad]
+            for org_id, unidad in zip(MAPEO_ROLES_ARQUETIPO['OrgRoleId'], MAPEO_ROLES_ARQUETIPO['OrgUnidArquetipo'])}
+    for rol, org_ids in CONFIG.get('roles_org_ids', {}).items():
+        for org_id in (org_ids if isinstance(org_ids, list) else [org_ids]):
+            mapa[_normalizar_atributo(pd.Series([org_id])).iloc[0]] = rol
+    return mapa
+
+#Directorio de usuarios de BS indexado por UserName, se construye una sola vez por ejecucion
+class UserDirectory:
+    """
+    Directorio de usuarios de Brightspace construido desde el DataFrame de leer_BDUsuarios_BS.
+    Reemplaza los recorridos completos de BDUsuarios por fila (Banner) con búsquedas O(1)
+    por UserName: existencia, OrgRoleId, OrgDefinedId, nombres y ExternalEmail.
+
+    Si hay UserName repetidos se conserva el primer registro (mismo criterio que .loc[...].iloc[0]).
+    Si BDUsuarios trae la columna IsActive se usa en sin_cambios(); si no, los usuarios se asumen activos.
+    """
+    COLUMNAS = ['FirstName', 'LastName', 'OrgRoleId', 'OrgDefinedId', 'ExternalEmail']
+    _POS_ROL = COLUMNAS.index('OrgRoleId')
+
+    def __init__(self, bd_usuarios):
+        if bd_usuarios is None:
+            bd_usuarios = pd.DataFrame(columns=['UserName'] + self.COLUMNAS)
+
+        df = bd_usuarios.drop_duplicates(subset=['UserName'], keep='first')
+        for col in self.COLUMNAS:
+            if col not in df.columns:
+                df = df.assign(**{col: ''})
+
+        # Tabla indexada por UserName para joins/merges vectorizados
+        self.tabla = df.set_index('UserName')[self.COLUMNAS]
+
+        # Datos normalizados para detectar UPDATE sin cambios (correo sin distinguir mayúsculas)
+        # y nombre del rol actual (OrgRoleId) para no repetir cambios de rol de arquetipo ya vigentes
+        self._atributos = pd.DataFrame({
+            'OrgDefinedId': _normalizar_atributo(self.tabla['OrgDefinedId']),
+            'FirstName': _normalizar_atributo(self.tabla['FirstName']),
+            'LastName': _normalizar_atributo(self.tabla['LastName']),
+            'ExternalEmail': _normalizar_atributo(self.tabla['ExternalEmail']).str.lower(),
+            'Rol': _normalizar_atributo(self.tabla['OrgRoleId']).map(mapa_roles_org()),
+            # Sin IsActive no se sabe si el usuario está activo: el UPDATE (que lo reactiva) no se puede omitir
+            'Activo': (_usuario_activo(df.set_index('UserName')['IsActive']) if 'IsActive' in df.columns
+                       else pd.Series(False, index=self.tabla.index)),
+        }, index=self.tabla.index)
+
+        # Diccionario UserName -> tupla de columnas para búsquedas puntuales
+        self._registros = dict(zip(
+            self.tabla.index,
+            zip(*(self.tabla[col] for col in self.COLUMNAS))
+        ))
+
+    def __len__(self):
+        return len(self._registros)
+
+    def __contains__(self, id_banner):
+        return id_banner in self._registros
+
+    def existe(self, id_banner):
+        """Indica si el usuario ya existe en Brightspace."""
+        return id_banner in self._registros
+
+    def existen(self, ids):
+        """Versión vectorizada de existe(): recibe una Serie de IDs y devuelve una Serie booleana."""
+        return ids.isin(self.tabla.index)
+
+    def obtener(self, id_banner):
+        """Devuelve un dict con las columnas del usuario o None si no existe."""
+        registro = self._registros.get(id_banner)
+        if registro is None:
+            return None
+        return dict(zip(self.COLUMNAS, registro))
+
+    def rol(self, id_banner):
+        """Devuelve el OrgRoleId del usuario o None si no existe."""
+        registro = self._registros.get(id_banner)
+        if registro is None:
+            return None
+        return registro[self._POS_ROL]
+
+    def sin_cambios(self, ids, org_defined_id, first_name, last_name, email):
+        """
+        Versión vectorizada de la comparación de datos para UPDATE: recibe Series alineadas
+        (mismo largo que ids) y devuelve un arreglo booleano, True donde el usuario existe, está
+        activo y su OrgDefinedId, nombres y correo normalizados coinciden con BDUsuarios.
+        """
+        actuales = self._atributos.reindex(ids.to_numpy())
+        iguales = actuales['Activo'].eq(True).to_numpy(copy=True)
+        iguales &= actuales['OrgDefinedId'].to_numpy() == _normalizar_atributo(org_defined_id).to_numpy()
+        iguales &= actuales['FirstName'].to_numpy() == _normalizar_atributo(first_name).to_numpy()
+        iguales &= actuales['LastName'].to_numpy() == _normalizar_atributo(last_name).to_numpy()
+        iguales &= actuales['ExternalEmail'].to_numpy() == _normalizar_atributo(email).str.lower().to_numpy()
+        return iguales
+
+    def tienen_rol(self, ids, roles):
+        """
+        Versión vectorizada del rol vigente: recibe ids y el rol objetivo (texto o Serie alineada)
+        y devuelve un arreglo booleano, True donde el OrgRoleId actual del usuario ya es ese rol.
+        """
+        actuales = self._atributos['Rol'].reindex(ids.to_numpy()).to_numpy()
+        objetivo = roles.to_numpy() if isinstance(roles, pd.Series) else roles
+        return actuales == objetivo
+
+#Normaliza un atributo de usuario para comparar Banner con BDUsuarios (vacíos, espacios y sufijo ".0")
+def _normalizar_atributo(serie):
+    texto = serie.map(lambda valor: "" if pd.isna(valor) else str(valor))
+    texto = texto.str.strip()
+    return texto.mask(texto.str.fullmatch(r'-?\d+\.0'), texto.str[:-2])
+
+#Interpreta la columna IsActive del export de usuarios (booleano, 1/0 o texto)
+def _usuario_activo(serie):
+    texto = serie.map(lambda valor: "" if pd.isna(valor) else str(valor)).str.strip().str.lower()
+    return texto.isin(['true', '1', '1.0', 'si', 'sí', 'yes', 'y', 'verdadero'])
+
+#
+#Registro de la ejecución con los comandos a nivel de usuario ya emitidos
+class RegistroUsuarios:
+    """
+    Registro de toda la ejecución de los comandos a nivel de usuario: CREATE/UPDATE y las
+    inscripciones/desinscripciones en unidades de arquetipo (UPBV, CVPR, CVFA, ...).
+    Cada comando se emite una sola vez aunque el usuario esté en varios cursos; las lineas se
+    escriben en un archivo propio que merge_archivos coloca antes de las inscripciones a cursos.
+
+    Clave de duplicado: CREATE/UPDATE por usuario (el primero gana); ENROLL/UNENROLL por linea completa.
+    """
+
+    def __init__(self):
+        self._claves = set()
+        self.lineas = []
+        self.omitidas = 0
+
+    def __len__(self):
+        return len(self.lineas)
+
+    @staticmethod
+    def _clave(linea):
+        accion, usuario = linea.split(',', 2)[:2]
+        if accion in ('CREATE', 'UPDATE'):
+            return ('USUARIO', usuario)
+        return linea
+
+    def registrar(self, lineas):
+        """Agrega las lineas que no se han emitido en la ejecución; devuelve cuántas eran nuevas."""
+        nuevas = 0
+        for linea in lineas:
+            clave = self._clave(linea)
+            if clave in self._claves:
+                self.omitidas += 1
+                continue
+            self._claves.add(clave)
+            self.lineas.append(linea)
+            nuevas += 1
+        return nuevas
+
+    def escribir(self, ruta):
+        """Escribe (en modo append, igual que los archivos por curso) las lineas únicas del registro."""
+        with open(ruta, 'a', encoding='utf8') as fptr:
+            fptr.write(''.join(linea + '\n' for linea in self.lineas))
+
+#Normaliza una columna de claves (PERIODO, LISTA_CRUZADA, NRC) a texto comparable entre Banner y shortnames.csv
+def _clave_texto(serie):
+    """
+    Convierte la Serie a texto sin espacios y sin el sufijo '.0' que deja Excel
+    cuando una columna numérica tiene celdas vacías (ej: 202610.0 -> '202610').
+    """
+    return serie.astype(str).str.strip().str.replace(r'\.0$', '', regex=True)
+
+#Particiona los registros de Banner por curso de shortnames.csv en una sola pasada
+def particionar_cursos(cursos, data):
+    """
+    Asigna a cada curso de shortnames.csv sus registros de Banner sin construir una máscara
+    booleana sobre todo el DataFrame por cada curso.
+
+    - Los registros de Banner se agrupan una sola vez por (PERIODO, LISTA_CRUZADA).
+    - Regla de negocio APLATAM: si el Periodo del curso tiene más de 6 caracteres se toman
+      solo los primeros 6 (se elimina V1, V2, etc).
+
+    Parámetros:
+        cursos (pd.DataFrame): shortnames.csv con columnas 'Nombre', 'NRC' y 'Periodo'.
+        data (pd.DataFrame): registros de Banner con columnas 'PERIODO' y 'LISTA_CRUZADA'.
+
+    Retorna:
+        Generador de tuplas (course_name, course_nrc, course_periodo, listado) en el orden de shortnames.csv.
+    """
+    periodos = _clave_texto(cursos['Periodo'])
+    periodos = periodos.where(periodos.str.len() <= 6, periodos.str[:6])
+    nrcs = _clave_texto(cursos['NRC'])
+
+    # Un solo groupby: (PERIODO, LISTA_CRUZADA) -> posiciones de las filas, en el orden original
+    grupos = data.groupby([_clave_texto(data['PERIODO']), _clave_texto(data['LISTA_CRUZADA'])], sort=False).indices
+    vacio = data.iloc[0:0]
+
+    for course_name, course_nrc, course_periodo, clave_nrc in zip(cursos['Nombre'], cursos['NRC'], periodos, nrcs):
+        posiciones = grupos.get((course_periodo, clave_nrc))
+        listado = data.iloc[posiciones] if posiciones is not None else vacio
+        yield course_name, course_nrc, course_periodo, listado
+
+#Formatea un numero de documento con separador de miles ('.'); si no es numerico se deja el valor original
+def _formatear_documento(valor):
+    try:
+        return "{:,}".format(int(valor)).replace(',', '.')
+    except Exception:
+        return str(valor)
+
+#Formatea la columna DOCUMENTO completa calculando el formato una sola vez por valor único
+def formatear_documentos(serie):
+    """
+    Versión por columna de _formatear_documento: los listados repiten documentos entre cursos,
+    por lo que el formato se calcula una vez por valor único y se asigna con map.
+    Retorna una Serie de textos con el mismo índice de la entrada.
+    """
+    formatos = {valor: _formatear_documento(valor) for valor in serie.unique()}
+    return serie.map(formatos).astype(object)
+
+#
+# Cache en disco de las hojas de Banner ya limpias
+#
+# Cada entrada se identifica por la ruta, tamaño, mtime y hash del contenido del libro, más una etiqueta
+# del consumidor (hoja + versión de la limpieza). Si se cambia la limpieza de una hoja se debe subir la
+# versión de su etiqueta para invalidar las entradas anteriores.
+CACHE_VERSION = 1
+_CACHE_DEPURADO = False
+
+#Directorio de la cache de Banner desde la configuración ("" o null la deshabilita)
+def _directorio_cache():
+    directorio = CONFIG.get('banner_cache_directory', './cache_banner/')
+    if not directorio:
+        return None
+    directorio = _resolve_path(directorio, './cache_banner/')
+    os.makedirs(directorio, exist_ok=True)
+    return directorio
+
+#Huella del libro: ruta, tamaño, mtime y hash SHA-256 del contenido
+def _huella_archivo(filepath):
+    estado = os.stat(filepath)
+    sha = hashlib.sha256()
+    with open(filepath, 'rb') as fp:
+        for bloque in iter(lambda: fp.read(1024 * 1024), b''):
+            sha.update(bloque)
+
+    return {
+        'ruta': os.path.abspath(filepath),
+        'tamano': estado.st_size,
+        'mtime': estado.st_mtime_ns,
+        'hash': sha.hexdigest()
+    }
+
+#Elimina entradas de la cache por antigüedad y luego las más viejas hasta cumplir el tamaño máximo
+def depurar_cache_banner():
+    """
+    Aplica la política de desalojo de la cache de Banner, una vez por proceso:
+      - banner_cache_max_dias: entradas sin uso por más días se eliminan (por defecto 7).
+      - banner_cache_max_mb: si el total supera el límite se eliminan las menos usadas (por defecto 2048).
+    """
+    global _CACHE_DEPURADO
+    directorio = _directorio_cache()
+    if directorio is None or _CACHE_DEPURADO:
+        return
+    _CACHE_DEPURADO = True
+
+    max_dias = float(CONFIG.get('banner_cache_max_dias', 7))
+    max_bytes = float(CONFIG.get('banner_cache_max_mb', 2048)) * 1024 * 1024
+    limite = time.time() - max_dias * 86400
+
+    entradas = []
+    for nombre in os.listdir(directorio):
+        ruta = os.path.join(directorio, nombre)
+        if not (os.path.isfile(ruta) and nombre.endswith('.pkl')):
+            continue
+        estado = os.stat(ruta)
+        if estado.st_mtime < limite:
+            _eliminar_entrada_cache(ruta)
+            continue
+        entradas.append((estado.st_mtime, estado.st_size, ruta))
+
+    total = sum(tamano for _, tamano, _ in entradas)
+    for _, tamano, ruta in sorted(entradas):
+        if total <= max_bytes:
+            break
+        _eliminar_entrada_cache(ruta)
+        total -= tamano
+
+#Elimina una entrada de la cache (otra ejecución pudo haberla eliminado antes)
+def _eliminar_entrada_cache(ruta):
+    try:
+        os.remove(ruta)
+    except FileNotFoundError:
+        pass
+
+#Clave de la entrada de cache para la huella del libro y la etiqueta del consumidor
+def _ruta_cache(directorio, huella, etiqueta):
+    clave = hashlib.sha256(
+        json.dumps([CACHE_VERSION, etiqueta, huella], sort_keys=True).encode('utf8')
+    ).hexdigest()
+    return os.path.join(directorio, f"{clave}.pkl")
+
+#Lee una entrada de la cache; devuelve None si no existe o no se puede leer
+def _leer_cache(ruta_cache):
+    if not os.path.isfile(ruta_cache):
+        return None
+    try:
+        df = pd.read_pickle(ruta_cache)
+        os.utime(ruta_cache)   # se marca como usada para la política de desalojo
+        return df
+    except Exception as e:
+        print(f"[WARN] Entrada de cache inválida {ruta_cache}, se vuelve a leer el libro: {e}")
+        return None
+
+#Guarda una entrada en la cache (escritura atómica: archivo temporal + os.replace)
+def _guardar_cache(ruta_cache, df):
+    """
+    Las entradas se guardan con pickle de pandas para conservar exactamente los tipos de las columnas
+    (DOCUMENTO mezcla números y textos, y los vacíos deben seguir siendo NaN).
+    """
+    try:
+        temporal = ruta_cache + '.tmp'
+        df.to_pickle(temporal)
+        os.replace(temporal, ruta_cache)
+    except Exception as e:
+        print(f"[WARN] No fue posible guardar la cache {ruta_cache}: {e}")
+
+# Limpia un valor convirtiéndolo a string, eliminando espacios y manejando valores nulos.
+def _to_clean_str(value):
+    if pd.isna(value):
+        return ""
+    return str(value).strip()
+
+#
+# Ingesta de los libros de Banner
+#
+# Cada libro se abre una sola vez y de él se extraen las hojas que piden los consumidores:
+#   - 'estudiantes':  segunda hoja, flujo de estudiantes (helpersestV2).
+#   - 'docentes':     primera hoja, flujo de moderadores (helpersmodV2).
+#   - 'centrocostos': hoja 'Estudiantes', CENTROCOSTOSESTUDIANTE del flujo de moderadores.
+# Si dos consumidores usan la misma hoja, la hoja se procesa una sola vez con la unión de sus columnas.
+
+# Definición de solo las columnas necesarias por consumidor
+COLUMNAS_ESTUDIANTES = {
+    'PERIODO', 'NRC', 'LISTA_CRUZADA', 'ID_ESTUDIANTE', 'TIPO_DOCUMENTO',
+    'DOCUMENTO', 'CORREO_ESTUDIANTE', 'NOMBRE_ESTUDIANTE','APELLIDO_ESTUDIANTE', 
+    'COD_INSCRIPCIÓN', 'ESTADO_INSCRIPCIÓN', 'FECHA_ACTIVIDAD_EST', "PAGO", "SOCIO_INTEGRADOR"
+}
+COLUMNAS_DOCENTES = {
+    'PERIODO', 'NRC', 'LISTA_CRUZADA', 'ID_DOCENTE', 'TIPO_DOCUMENTO',
+    'DOCUMENTO', 'CORREO_DOCENTE', 'NOMBRE_DOCENTE', 'APELLIDO_DOCENTE',"FECHA_ACTIVIDAD_DOC"
+}
+COLUMNAS_CENTROCOSTOS = ['PERIODO', 'LISTA_CRUZADA', 'ESTADO_INSCRIPCIÓN', 'COD_PROGRAMA_ESTUDIANTE']
+
+#Limpieza de la hoja de estudiantes (sin filtro de fecha)
+def _limpiar_estudiantes(df, file):
+    # Filtrar solo las columnas necesarias
+    df = df[list(COLUMNAS_ESTUDIANTES)].copy()
+
+    # Limpieza y transformación de datos :espacios, tipos de datos y tipo titulo
+    df['ID_ESTUDIANTE'] = df['ID_ESTUDIANTE'].astype(str).str.zfill(9)
+    df['LISTA_CRUZADA'] = df['LISTA_CRUZADA'].astype(str)
+    df['COD_INSCRIPCIÓN'] = df['COD_INSCRIPCIÓN'].astype(str)
+    df['ESTADO_INSCRIPCIÓN'] = df['ESTADO_INSCRIPCIÓN'].astype(str)
+    df['NOMBRE_ESTUDIANTE'] = df['NOMBRE_ESTUDIANTE'].astype(str).str.strip().str.title()
+    df['APELLIDO_ESTUDIANTE'] = df['APELLIDO_ESTUDIANTE'].astype(str).str.strip().str.title()
+    df['SOCIO_INTEGRADOR'] = df['SOCIO_INTEGRADOR'].astype(str).str.strip() #socio integrador
+    df['PAGO'] = df['PAGO'].astype(str)                                     #pago Y/N
+    df['FECHA_ACTIVIDAD_EST'] = pd.to_datetime(df['FECHA_ACTIVIDAD_EST'], errors='coerce')
+    return df
+
+#Limpieza de la hoja de docentes (sin filtro de fecha)
+def _limpiar_docentes(df, file):
+    # Filtrar solo las columnas necesarias
+    df = df[list(COLUMNAS_DOCENTES)].copy()
+
+    # Limpieza y transformación de datos :espacios, tipos de datos y tipo titulo
+    df['ID_DOCENTE'] = df['ID_DOCENTE'].astype(str).str.zfill(9)
+    df['LISTA_CRUZADA'] = df['LISTA_CRUZADA'].astype(str)
+    df['NOMBRE_DOCENTE'] = df['NOMBRE_DOCENTE'].astype(str).str.strip().str.title()
+    df['APELLIDO_DOCENTE'] = df['APELLIDO_DOCENTE'].astype(str).str.strip().str.title()
+    df['FECHA_ACTIVIDAD_DOC'] = pd.to_datetime(df['FECHA_ACTIVIDAD_DOC'], errors='coerce')
+    return df
+
+#Limpieza de la hoja Estudiantes para CENTROCOSTOSESTUDIANTE: solo inscritos con periodo, NRC/LC y programa
+def _limpiar_centrocostos(df, file):
+    df = df[COLUMNAS_CENTROCOSTOS].copy()
+    df['PERIODO'] = df['PERIODO'].apply(_to_clean_str)
+    df['LISTA_CRUZADA'] = df['LISTA_CRUZADA'].apply(_to_clean_str)
+    df['ESTADO_INSCRIPCIÓN'] = df['ESTADO_INSCRIPCIÓN'].apply(_to_clean_str)
+    df['COD_PROGRAMA_ESTUDIANTE'] = df['COD_PROGRAMA_ESTUDIANTE'].apply(_to_clean_str)
+
+    # Solo se conservan estudiantes inscritos.
+    df = df[df['ESTADO_INSCRIPCIÓN'].str.lower() == 'inscrito']
+    df = df[
+        (df['PERIODO'] != '') &
+        (df['LISTA_CRUZADA'] != '') &
+        (df['COD_PROGRAMA_ESTUDIANTE'] != '')
+    ]
+    return df
+
+# Consumidores de las hojas de Banner: hoja (índice o nombre), columnas, tipos de lectura,
+# limpieza, columna de fecha para el filtro y etiqueta de cache.
+CONSUMIDORES_BANNER = {
+    'estudiantes': {
+        'hoja': 1, 'columnas': COLUMNAS_ESTUDIANTES, 'dtype': {'ID_ESTUDIANTE': str},
+        'limpiar': _limpiar_estudiantes, 'fecha': 'FECHA_ACTIVIDAD_EST', 'cache': 'estudiantes-v2'
+    },
+    'docentes': {
+        'hoja': 0, 'columnas': COLUMNAS_DOCENTES, 'dtype': {'ID_DOCENTE': str, 'LISTA_CRUZADA': str},
+        'limpiar': _limpiar_docentes, 'fecha': 'FECHA_ACTIVIDAD_DOC', 'cache': 'docentes-v2'
+    },
+    'centrocostos': {
+        'hoja': 'Estudiantes', 'columnas': set(COLUMNAS_CENTROCOSTOS), 'dtype': {},
+        'limpiar': _limpiar_centrocostos, 'fecha': None, 'cache': 'centrocostos-v2'
+    },
+}
+
+#Convierte el valor de una celda igual que pandas.read_excel (motor openpyxl)
+def _convertir_celda(valor):
+    if valor is None:
+        return ""
+    if isinstance(valor, float) and valor.is_integer():
+        return int(valor)
+    if isinstance(valor, str) and valor in ERROR_CODES:
+        return np.nan
+    return valor
+
+#Indica si el valor de fecha de una celda cumple la fecha de corte (vacíos y no convertibles se descartan)
+def _cumple_corte(valor, corte):
+    if valor is None:
+        return False
+    if not isinstance(valor, datetime):
+        valor = pd.to_datetime(valor, errors='coerce')
+        if pd.isna(valor):
+            return False
+    return valor >= corte
+
+#Lector en streaming de una hoja: proyecta las columnas requeridas y marca las filas que cumplen la fecha de corte
+def _leer_hoja_streaming(libro, hoja, columnas, dtype, columna_fecha=None, corte=None):
+    """
+    Recorre la hoja fila a fila con openpyxl en modo solo lectura. El encabezado se resuelve una
+    sola vez y de cada fila solo se decodifican las columnas requeridas.
+
+    Las celdas se convierten y tipan igual que pandas.read_excel (TextParser con los mismos
+    valores nulos y dtype) sobre todas las filas de la hoja, por lo que el DataFrame es equivalente
+    al de read_excel restringido a las columnas requeridas. Si hay fecha de corte, las filas anteriores
+    (o sin fecha) se descartan después de inferir los tipos: el resultado tiene los mismos dtypes
+    con y sin corte (p. ej. PERIODO/NRC siguen siendo float si la hoja tiene celdas vacías).
+    """
+    ws = libro[hoja]
+    ws.reset_dimensions()
+    filas = ws.iter_rows(values_only=True)
+
+    encabezado = next(filas, None)
+    if encabezado is None:
+        return pd.DataFrame()
+
+    # Posiciones de las columnas requeridas (ante nombres repetidos se usa la primera, como pandas)
+    nombres, posiciones = [], []
+    for posicion, nombre in enumerate(encabezado):
+        if nombre in columnas and nombre not in nombres:
+            nombres.append(nombre)
+            posiciones.append(posicion)
+
+    posicion_fecha = None
+    if corte is not None and columna_fecha in nombres:
+        posicion_fecha = posiciones[nombres.index(columna_fecha)]
+
+    datos = []
+    vigentes = []
+    ultima_con_datos = -1
+    for fila in filas:
+        if any(valor is not None for valor in fila):
+            ultima_con_datos = len(datos)
+        if posicion_fecha is not None:
+            vigentes.append(posicion_fecha < len(fila) and _cumple_corte(fila[posicion_fecha], corte))
+
+        datos.append([_convertir_celda(fila[p]) if p < len(fila) else "" for p in posiciones])
+
+    # Se descartan las filas vacías al final de la hoja (igual que read_excel)
+    datos = datos[:ultima_con_datos + 1]
+
+    dtype = {columna: tipo for columna, tipo in dtype.items() if columna in nombres}
+    df = TextParser([nombres] + datos, header=0, dtype=dtype, skip_blank_lines=False).read()
+    if posicion_fecha is None:
+        return df
+    return df[vigentes[:len(df)]].reset_index(drop=True)
+
+#Etiqueta de cache de un consumidor: la entrada es la hoja limpia sin filtro de fecha (vale para cualquier corte)
+def _etiqueta_cache(nombre):
+    return CONSUMIDORES_BANNER[nombre]['cache']
+
+#Lee en una sola apertura del libro las hojas que necesitan los consumidores indicados
+def leer_libro_banner(filepath, consumidores, date='nodate'):
+    """
+    Abre el libro de Banner una sola vez y devuelve un dict consumidor -> DataFrame limpio
+    (None si la hoja no existe, no se puede leer o le faltan columnas requeridas).
+
+    Los consumidores que ya están en la cache de Banner no requieren abrir el libro.
+    Con la cache habilitada se lee y guarda la hoja completa (sin fecha de corte) y el corte lo aplica
+    _procesar_libro_banner; sin cache, las filas anteriores al corte se descartan en la lectura, después
+    de inferir los tipos sobre toda la hoja (mismos dtypes con y sin cache).
+    """
+    file = os.path.basename(filepath)
+    resultado = {}
+
+    directorio = _directorio_cache()
+    huella = _huella_archivo(filepath) if directorio else None
+    corte = None if date == 'nodate' or directorio else pd.to_datetime(date)
+
+    pendientes = []
+    for nombre in consumidores:
+        df = None
+        if directorio:
+            df = _leer_cache(_ruta_cache(directorio, huella, _etiqueta_cache(nombre)))
+        if df is not None:
+            print(f"[OK] Cache Banner ({nombre}): {file} con {df.shape[0]} filas.")
+            resultado[nombre] = df
+        else:
+            pendientes.append(nombre)
+
+    if not pendientes:
+        return resultado
+
+    libro = None
+    try:
+        libro = load_workbook(filepath, read_only=True, data_only=True, keep_links=False)
+
+        # Agrupar consumidores por hoja para procesar cada hoja una sola vez
+        por_hoja = {}
+        for nombre in pendientes:
+            hoja = CONSUMIDORES_BANNER[nombre]['hoja']
+            if isinstance(hoja, int):
+                hoja = libro.sheetnames[hoja] if hoja < len(libro.sheetnames) else None
+            if hoja not in libro.sheetnames:
+                print(f"[ERROR] El archivo {file} no tiene la hoja requerida por '{nombre}'.")
+                resultado[nombre] = None
+                continue
+            por_hoja.setdefault(hoja, []).append(nombre)
+
+        for hoja, grupo in por_hoja.items():
+            columnas = set().union(*(CONSUMIDORES_BANNER[nombre]['columnas'] for nombre in grupo))
+            dtype = {}
+            for nombre in grupo:
+                dtype.update(CONSUMIDORES_BANNER[nombre]['dtype'])
+
+            # El filtro de fecha se aplica en la lectura si todos los consumidores de la hoja usan la misma columna
+            fechas = {CONSUMIDORES_BANNER[nombre]['fecha'] for nombre in grupo}
+            columna_fecha = fechas.pop() if len(fechas) == 1 else None
+
+            try:
+                crudo = _leer_hoja_streaming(libro, hoja, columnas, dtype, columna_fecha, corte)
+                print(f"[OK] Hoja '{hoja}' de '{file}' cargada con {crudo.shape[0]} filas y {crudo.shape[1]} columnas.")
+            except Exception as e:
+                print(f"[ERROR] Error al leer la hoja '{hoja}' de {file}: {e}")
+                for nombre in grupo:
+                    resultado[nombre] = None
+                continue
+
+            for nombre in grupo:
+                spec = CONSUMIDORES_BANNER[nombre]
+
+                # Validar columnas requeridas existan en el excel
+                faltantes = set(spec['columnas']) - set(crudo.columns)
+                if faltantes:
+                    print(f"[WARN] Advertencia: El archivo {file} no tiene todas las columnas requeridas ({nombre}): {faltantes}")
+                    resultado[nombre] = None
+                    continue
+
+                try:
+                    df = spec['limpiar'](crudo, file)
+                except Exception as e:
+                    print(f"[ERROR] Error al limpiar la hoja '{hoja}' ({nombre}) de {file}: {e}")
+                    resultado[nombre] = None
+                    continue
+
+                resultado[nombre] = df
+                if directorio:
+                    _guardar_cache(_ruta_cache(directorio, huella, _etiqueta_cache(nombre)), df)
+
+    except Exception as e:
+        print(f"[ERROR] Error al leer el archivo {file}: {e}")
+        for nombre in pendientes:
+            resultado.setdefault(nombre, None)
+    finally:
+        if libro is not None:
+            libro.close()
+
+    return resultado
+
+#
+# Preflight de encabezados: valida hojas y columnas leyendo solo la primera fila de cada hoja
+#
+_NS_HOJA = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+_NS_REL = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}'
+
+#Convierte la referencia de columna de una celda (ej: 'AB12') en su posición (base 0)
+def _posicion_columna(referencia):
+    posicion = 0
+    for letra in referencia:
+        if not letra.isalpha():
+            break
+        posicion = posicion * 26 + (ord(letra.upper()) - 64)
+    return posicion - 1
+
+#Lee los encabezados (primera fila) de las hojas indicadas directamente del XML del libro
+def _leer_encabezados_xlsx(filepath, hojas):
+    """
+    Retorna un dict hoja (índice o nombre, como se pidió) -> lista de encabezados, o None si la hoja no existe.
+    No carga el libro: lee workbook.xml, la primera fila de cada hoja pedida y solo las cadenas
+    compartidas necesarias para esos encabezados.
+    """
+    with zipfile.ZipFile(filepath) as libro:
+        workbook = ET.fromstring(libro.read('xl/workbook.xml'))
+        relaciones = ET.fromstring(libro.read('xl/_rels/workbook.xml.rels'))
+        destinos = {rel.get('Id'): rel.get('Target') for rel in relaciones}
+
+        hojas_libro = []
+        for hoja in workbook.iter(f'{_NS_HOJA}sheet'):
+            destino = destinos.get(hoja.get(f'{_NS_REL}id'), '')
+            ruta = destino.lstrip('/') if destino.startswith('/') else posixpath.normpath(posixpath.join('xl', destino))
+            hojas_libro.append((hoja.get('name'), ruta))
+
+        # Primera fila de cada hoja pedida: (tipo, valor) por posición de columna
+        filas = {}
+        indices_compartidos = set()
+        for pedida in hojas:
+            if isinstance(pedida, int):
+                encontrada = hojas_libro[pedida] if pedida < len(hojas_libro) else None
+            else:
+                encontrada = next((h for h in hojas_libro if h[0] == pedida), None)
+            if encontrada is None:
+                filas[pedida] = None
+                continue
+
+            celdas = {}
+            with libro.open(encontrada[1]) as xml_hoja:
+                for evento, elemento in ET.iterparse(xml_hoja, events=('end',)):
+                    if elemento.tag == f'{_NS_HOJA}c':
+                        tipo = elemento.get('t', 'n')
+                        if tipo == 'inlineStr':
+                            valor = ''.join(t.text or '' for t in elemento.iter(f'{_NS_HOJA}t'))
+                        else:
+                            nodo_valor = elemento.find(f'{_NS_HOJA}v')
+                            valor = nodo_valor.text if nodo_valor is not None else None
+                        if tipo == 's' and valor is not None:
+                            indices_compartidos.add(int(valor))
+                        celdas[_posicion_columna(elemento.get('r', ''))] = (tipo, valor)
+                    elif elemento.tag == f'{_NS_HOJA}row':
+                        break
+            filas[pedida] = celdas
+
+        # Cadenas compartidas: se recorre sharedStrings.xml solo hasta el mayor índice usado
+        compartidas = {}
+        if indices_compartidos and 'xl/sharedStrings.xml' in libro.namelist():
+            maximo = max(indices_compartidos)
+            with libro.open('xl/sharedStrings.xml') as xml_cadenas:
+                indice = 0
+                for evento, elemento in ET.iterparse(xml_cadenas, events=('end',)):
+                    if elemento.tag != f'{_NS_HOJA}si':
+                        continue
+                    if indice in indices_compartidos:
+                        # Texto del elemento y de sus fragmentos con formato, sin la guía fonética (rPh)
+                        textos = [t.text or '' for t in elemento.findall(f'{_NS_HOJA}t')]
+                        textos += [t.text or '' for t in elemento.findall(f'{_NS_HOJA}r/{_NS_HOJA}t')]
+                        compartidas[indice] = ''.join(textos)
+                    elemento.clear()
+                    if indice >= maximo:
+                        break
+                    indice += 1
+
+    encabezados = {}
+    for pedida, celdas in filas.items():
+        if celdas is None:
+            encabezados[pedida] = None
+            continue
+        nombres = []
+        for posicion in sorted(celdas):
+            tipo, valor = celdas[posicion]
+            nombres.append(compartidas.get(int(valor)) if tipo == 's' and valor is not None else valor)
+        encabezados[pedida] = nombres
+    return encabezados
+
+#Valida los encabezados de un libro para cada consumidor; devuelve dict consumidor -> problema (None si está bien)
+def _validar_encabezados(filepath, consumidores):
+    try:
+        hojas = list(dict.fromkeys(CONSUMIDORES_BANNER[nombre]['hoja'] for nombre in consumidores))
+        encabezados = _leer_encabezados_xlsx(filepath, hojas)
+    except Exception as e:
+        return {nombre: f"no se pudo leer el encabezado ({e})" for nombre in consumidores}
+
+    problemas = {}
+    for nombre in consumidores:
+        spec = CONSUMIDORES_BANNER[nombre]
+        columnas = encabezados.get(spec['hoja'])
+        if columnas is None:
+            problemas[nombre] = f"no tiene la hoja {spec['hoja']!r}"
+            continue
+        faltantes = set(spec['columnas']) - set(columnas)
+        problemas[nombre] = f"faltan columnas {sorted(faltantes)}" if faltantes else None
+    return problemas
+
+#Preflight de encabezados de todos los libros antes de la lectura completa
+def preflight_banner(rutas, consumidores):
+    """
+    Lee en paralelo solo la fila de encabezados de las hojas que necesita cada consumidor en
+    todos los libros, informa en un solo resumen los archivos con hojas o columnas faltantes y
+    devuelve un dict ruta -> lista de consumidores válidos para ese libro (los libros sin
+    consumidores válidos se excluyen de la lectura completa).
+    """
+    with ThreadPoolExecutor(max_workers=max(1, min(16, len(rutas)))) as pool:
+        resultados = list(pool.map(_validar_encabezados, rutas, repeat(consumidores)))
+
+    validos = {}
+    problemas = []
+    for ruta, problemas_libro in zip(rutas, resultados):
+        aceptados = [nombre for nombre in consumidores if problemas_libro[nombre] is None]
+        if aceptados:
+            validos[ruta] = aceptados
+        for nombre in consumidores:
+            if problemas_libro[nombre] is not None:
+                problemas.append(f"   - {os.path.basename(ruta)} ({nombre}): {problemas_libro[nombre]}")
+
+    if problemas:
+        print(f"[WARN] Preflight Banner: {len(problemas)} problema(s) de encabezado, se excluyen de la lectura:")
+        print("\n".join(problemas))
+    else:
+        print(f"[OK] Preflight Banner: {len(rutas)} archivo(s) con hojas y columnas requeridas.")
+
+    return validos
+
+#Procesa un libro de Banner completo: lectura, limpieza y filtro de fecha (se ejecuta en un proceso del pool)
+def _procesar_libro_banner(filepath, consumidores, date='nodate'):
+    print(f"[INFO] Leyendo archivo: {filepath}")
+
+    frames = {}
+    for nombre, df in leer_libro_banner(filepath, consumidores, date).items():
+        if df is None:
+            continue
+
+        #se filtra por la fecha de actividad
+        columna_fecha = CONSUMIDORES_BANNER[nombre]['fecha']
+        if columna_fecha and date != 'nodate':
+            df = df[df[columna_fecha] >= pd.to_datetime(date)]
+
+        frames[nombre] = df
+    return frames
+
+#Ingesta de todos los libros de banner_directory para los consumidores indicados
+def ingerir_banner(consumidores, date='nodate'):
+    """
+    Lee todos los archivos .xlsx de banner_directory abriendo cada libro una sola vez y
+    devuelve un dict consumidor -> DataFrame consolidado.
+
+    Con banner_workers > 1 (config.json) cada libro se procesa en un proceso independiente
+    (lectura, limpieza y filtro de fecha). Los resultados siempre se concatenan en el orden
+    alfabético de los archivos, sin importar el orden en que terminen los procesos.
+
+    Parámetros:
+        consumidores (list): nombres en CONSUMIDORES_BANNER ('estudiantes', 'docentes', 'centrocostos').
+        date (str): Fecha mínima para filtrar la columna de fecha de actividad de cada consumidor.
+    """
+    directory = _resolve_path(CONFIG.get('banner_directory', './'), './')
+
+    # Validación de existencia del directorio
+    if not os.path.isdir(directory):
+        raise FileNotFoundError(f"[ERROR] No se encontró el directorio de archivos .xlsx: {directory}")
+
+    excel_files = sorted(f for f in os.listdir(directory) if f.endswith(".xlsx") and not f.startswith("~$"))
+
+    # Validación de archivos excel en el directorio
+    if not excel_files:
+        raise FileNotFoundError("[ERROR] No se encontró ningún archivo .xlsx en el directorio actual.")
+
+    rutas = [os.path.join(directory, file) for file in excel_files]
+
+    # Preflight: solo se leen completos los libros (y hojas) con los encabezados requeridos
+    validos = preflight_banner(rutas, consumidores)
+    rutas = [ruta for ruta in rutas if ruta in validos]
+    consumidores_ruta = [validos[ruta] for ruta in rutas]
+
+    # La política de desalojo de la cache se aplica una sola vez, antes de repartir los libros
+    depurar_cache_banner()
+
+    workers = max(1, min(int(CONFIG.get('banner_workers', 1)), len(rutas)))
+    if workers > 1:
+        print(f"[INFO] Ingesta de {len(rutas)} archivos de Banner con {workers} procesos.")
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            resultados = list(pool.map(_procesar_libro_banner, rutas, consumidores_ruta, repeat(date)))
+    else:
+        resultados = [_procesar_libro_banner(ruta, nombres, date) for ruta, nombres in zip(rutas, consumidores_ruta)]
+
+    dataframes = {nombre: [] for nombre in consumidores}
+    for frames in resultados:
+        for nombre, df in frames.items():
+            dataframes[nombre].append(df)
+
+    resultado = {}
+    for nombre, frames in dataframes.items():
+        if not frames:
+            raise ValueError(f"[ERROR] Ningún archivo válido fue procesado correctamente ({nombre}).")
+
+        # Concatenar todos los DataFrames en uno solo
+        resultado[nombre] = pd.concat(frames, ignore_index=True)
+
+    return resultado
+
+#
+# Consolidado de salida: registro_unico*.txt
+#
+BUFFER_MERGE = 1024 * 1024
+# Prefijo de los archivos de comandos a nivel de usuario de cada flujo (registro_usuarios_Est.txt, registro_usuarios_MOD.txt)
+PREFIJO_USUARIOS = 'registro_usuarios_'
+
+#Une en un solo archivo los registros de la carpeta de salida, en orden reproducible y sin cargarlos en memoria
+def merge_registros(directory, destino, archivo_usuarios=None):
+    """
+    Abre el consolidado una sola vez (modo append) y copia por bloques cada .txt de la carpeta
+    de salida: primero archivo_usuarios (comandos a nivel de usuario), luego los registro_usuarios_*.txt
+    de otros flujos que compartan la carpeta y al final los registros de los cursos en orden alfabético.
+    Así ningún ENROLL queda antes del CREATE de su usuario. La memoria usada no depende del tamaño de los archivos.
+
+    Si la configuración tiene "merge_gzip": true el consolidado se escribe comprimido en destino + '.gz'.
+
+    Retorna:
+        str: ruta del consolidado escrito.
+    """
+    archivos = sorted(filename for filename in os.listdir(directory) if filename.endswith('.txt'))
+    usuarios = [filename for filename in archivos if filename.startswith(PREFIJO_USUARIOS)]
+    if archivo_usuarios in usuarios:
+        usuarios.remove(archivo_usuarios)
+        usuarios.insert(0, archivo_usuarios)
+    archivos = usuarios + [filename for filename in archivos if not filename.startswith(PREFIJO_USUARIOS)]
+
+    if CONFIG.get('merge_gzip', False):
+        destino = destino + '.gz'
+        salida = gzip.open(destino, 'ab')
+    else:
+        salida = open(destino, 'ab', buffering=BUFFER_MERGE)
+
+    with salida:
+        for filename in archivos:
+            with open(os.path.join(directory, filename), 'rb') as fp:
+                shutil.copyfileobj(fp, salida, BUFFER_MERGE)
+
+    return destino
+
+#
+# Modo de salida única: un solo consolidado + índice por curso, sin archivos por curso ni merge
+#
+#Codifica lineas de comandos igual que un archivo abierto en modo texto (fin de linea del sistema)
+def _codificar_lineas(lineas):
+    return ''.join(linea + os.linesep for linea in lineas).encode('utf8')
+
+#Tamaño (sin comprimir) del consolidado existente, para calcular los desplazamientos del índice
+def _tamano_consolidado(destino, comprimido):
+    if not os.path.exists(destino):
+        return 0
+    if not comprimido:
+        return os.path.getsize(destino)
+    tamano = 0
+    with gzip.open(destino, 'rb') as fp:
+        for bloque in iter(lambda: fp.read(BUFFER_MERGE), b''):
+            tamano += len(bloque)
+    return tamano
+
+class SalidaUnica:
+    """
+    Escritura directa del consolidado registro_unico*.txt sin archivos por curso ni merge_archivos.
+
+    Las lineas de cada curso se acumulan en un archivo temporal local (fuera de salida_directory,
+    para no disparar la sincronización de OneDrive) y al cerrar se escriben en el consolidado:
+    primero los comandos a nivel de usuario (RegistroUsuarios) y luego los cursos en orden de
+    proceso. El índice CSV (archivo, offset, bytes, lineas) indica dónde quedó cada sección del
+    consolidado; con derivar_registros_cursos se regeneran los registro_<curso>.txt a demanda.
+    """
+    COLUMNAS_INDICE = ['archivo', 'offset', 'bytes', 'lineas']
+
+    def __init__(self, destino, ruta_indice, archivo_usuarios):
+        self.comprimido = bool(CONFIG.get('merge_gzip', False))
+        self.destino = destino + '.gz' if self.comprimido else destino
+        self.ruta_indice = ruta_indice
+        self.archivo_usuarios = archivo_usuarios
+        self._cuerpo = tempfile.TemporaryFile()
+        self._secciones = []
+
+    def escribir_curso(self, course_name, lineas):
+        """Agrega al cuerpo las lineas del curso (equivale a registro_<curso>.txt)."""
+        datos = _codificar_lineas(lineas)
+        self._cuerpo.write(datos)
+        self._secciones.append([f"registro_{course_name}.txt", len(datos), len(lineas)])
+
+    def cerrar(self, registro=None):
+        """Escribe el consolidado (append) y el índice; devuelve la ruta del consolidado."""
+        usuarios = registro.lineas if registro is not None else []
+        datos_usuarios = _codificar_lineas(usuarios)
+        secciones = [[self.archivo_usuarios, len(datos_usuarios), len(usuarios)]] if usuarios else []
+        secciones += self._secciones
+
+        offset = _tamano_consolidado(self.destino, self.comprimido)
+        salida = gzip.open(self.destino, 'ab') if self.comprimido else open(self.destino, 'ab', buffering=BUFFER_MERGE)
+        with salida:
+            salida.write(datos_usuarios)
+            self._cuerpo.seek(0)
+            shutil.copyfileobj(self._cuerpo, salida, BUFFER_MERGE)
+        self._cuerpo.close()
+
+        with open(self.ruta_indice, 'w', encoding='utf8', newline='') as fp:
+            writer = csv.writer(fp)
+            writer.writerow(self.COLUMNAS_INDICE)
+            for archivo, tamano, lineas in secciones:
+                writer.writerow([archivo, offset, tamano, lineas])
+                offset += tamano
+
+        print(f"[OK] Consolidado '{self.destino}' escrito con {len(secciones)} secciones; índice en '{self.ruta_indice}'.")
+        return self.destino
+
+#Regenera los archivos por curso a partir del consolidado y su índice (modo de salida única)
+def derivar_registros_cursos(consolidado, ruta_indice, directory, archivos=None):
+    """
+    Lee el índice de SalidaUnica y copia cada sección del consolidado a directory/<archivo>.
+    archivos: lista opcional de nombres (ej: ['registro_CURSO.txt']) para derivar solo esos.
+    Un curso que aparece varias veces en la ejecución se reconstruye con todas sus secciones, en orden.
+
+    Retorna:
+        list: rutas de los archivos escritos.
+    """
+    indice = pd.read_csv(ruta_indice, dtype={'archivo': str})
+    if archivos is not None:
+        indice = indice[indice['archivo'].isin(archivos)]
+
+    os.makedirs(directory, exist_ok=True)
+    abrir = gzip.open if consolidado.endswith('.gz') else open
+    escritos = []
+    with abrir(consolidado, 'rb') as fuente:
+        for archivo, offset, tamano in zip(indice['archivo'], indice['offset'], indice['bytes']):
+            ruta = os.path.join(directory, archivo)
+            with open(ruta, 'ab' if ruta in escritos else 'wb') as fp:
+                fuente.seek(int(offset))
+                restante = int(tamano)
+                while restante > 0:
+                    bloque = fuente.read(min(BUFFER_MERGE, restante))
+                    if not bloque:
+                        break
+                    fp.write(bloque)
+                    restante -= len(bloque)
+            if ruta not in escritos:
+                escritos.append(ruta)
+
+    print(f"[OK] {len(escritos)} archivo(s) por curso derivados en '{directory}'.")
+    return escritos
+
+#
+# Modo delta: solo se emiten los cambios respecto a la ejecución anterior
+#
+DELTA_VERSION = 2
+
+#Huella de los datos de usuario de una linea CREATE/UPDATE (documento, nombres y correo)
+def _huella_usuario(campos):
+    datos = '|'.join(campos[2:5] + campos[-1:])
+    return hashlib.blake2b(datos.encode('utf8'), digest_size=8).digest()
+
+class DeltaEjecucion:
+    """
+    Filtro de lineas contra el snapshot de la ejecución anterior (modo delta).
+
+    El snapshot guarda las inscripciones emitidas como unidad -> {usuario: rol} y una huella
+    por usuario de sus datos (documento, nombres, correo). En modo delta:
+      - ENROLL se omite si el usuario ya tenía ese mismo rol en la unidad. Como en Brightspace un
+        ENROLL reemplaza el rol del usuario en la unidad, cada ENROLL emitido sobrescribe el rol vigente.
+      - CREATE/UPDATE se omite si la huella de datos del usuario no cambió.
+      - UNENROLL siempre se emite y saca la inscripción del snapshot.
+      - Con permitir_bajas, en cada curso procesado se agrega UNENROLL para quien estaba en el
+        snapshot del curso y ya no aparece (solo cursos de la ejecución con inscripciones actuales),
+        salvo los usuarios de excluir, cuya baja emite otra operación de la misma ejecución.
+    El snapshot resultante (anterior + cambios) se guarda al final con guardar().
+    """
+
+    def __init__(self, ruta_snapshot, permitir_bajas=False):
+        self.ruta_snapshot = ruta_snapshot
+        self.permitir_bajas = permitir_bajas
+        self.omitidas = 0
+        self.bajas = 0
+        self._inscripciones, self._usuarios = self._cargar()
+
+    def _cargar(self):
+        if not os.path.exists(self.ruta_snapshot):
+            print(f"[INFO] Modo delta sin snapshot previo ('{self.ruta_snapshot}'): se emiten todas las lineas.")
+            return {}, {}
+        try:
+            with open(self.ruta_snapshot, 'rb') as fp:
+                snapshot = pickle.load(fp)
+            if snapshot.get('version') != DELTA_VERSION:
+                raise ValueError(f"versión {snapshot.get('version')}")
+            return snapshot['inscripciones'], snapshot['usuarios']
+        except Exception as e:
+            print(f"[WARN] Snapshot delta inválido ({e}); se emiten todas las lineas.")
+            return {}, {}
+
+    def filtrar(self, lineas):
+        """Devuelve solo las lineas que cambian el estado respecto al snapshot y lo actualiza."""
+        salida = []
+        for linea in lineas:
+            campos = linea.split(',')
+            accion, usuario = campos[0], campos[1]
+            if accion == 'ENROLL':
+                unidad, rol = campos[4], campos[3]
+                inscritos = self._inscripciones.setdefault(unidad, {})
+                if inscritos.get(usuario) == rol:
+                    self.omitidas += 1
+                    continue
+                inscritos[usuario] = rol
+            elif accion == 'UNENROLL':
+                self._inscripciones.get(campos[3], {}).pop(usuario, None)
+            else:
+                huella = _huella_usuario(campos)
+                if self._usuarios.get(usuario) == huella:
+                    self.omitidas += 1
+                    continue
+                self._usuarios[usuario] = huella
+            salida.append(linea)
+        return salida
+
+    def filtrar_curso(self, course_name, lineas, excluir=()):
+        """
+        filtrar() para las lineas de un curso, más las bajas del curso si están habilitadas.
+        Los usuarios de excluir salen del snapshot del curso sin agregar su UNENROLL (ya lo emite otra operación).
+        """
+        actuales = {campos[1] for campos in (linea.split(',') for linea in lineas)
+                    if campos[0] == 'ENROLL' and campos[4] == course_name}
+        anteriores = list(self._inscripciones.get(course_name, {}))
+        salida = self.filtrar(lineas)
+
+        if self.permitir_bajas and actuales:
+            retirados = [usuario for usuario in anteriores if usuario not in actuales]
+            inscritos = self._inscripciones[course_name]
+            for usuario in retirados:
+                inscritos.pop(usuario, None)
+                if usuario not in excluir:
+                    salida.append(f'UNENROLL,{usuario},,{course_name}')
+                    self.bajas += 1
+        return salida
+
+    def guardar(self):
+        """Guarda el snapshot actualizado (escritura atómica: .tmp + os.replace)."""
+        directorio = os.path.dirname(self.ruta_snapshot)
+        if directorio:
+            os.makedirs(directorio, exist_ok=True)
+        temporal = self.ruta_snapshot + '.tmp'
+        snapshot = {'version': DELTA_VERSION, 'inscripciones': self._inscripciones, 'usuarios': self._usuarios}
+        with open(temporal, 'wb') as fp:
+            pickle.dump(snapshot, fp, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temporal, self.ruta_snapshot)
+        print(f"[OK] Modo delta: {self.omitidas} lineas sin cambios omitidas, {self.bajas} bajas; snapshot en '{self.ruta_snapshot}'.")
+
+#
+# Conciliación contra el export de inscripciones de Brightspace (UserName, OrgUnitCode, RoleName)
+#
+COLUMNAS_INSCRIPCIONES_BS = ['UserName', 'OrgUnitCode', 'RoleName']
+
+class ReconciliacionBS:
+    """
+    Cruce por hash de los comandos generados con las inscripciones vigentes en Brightspace:
+      - ENROLL se omite si (usuario, unidad, rol) ya existe en el export.
+      - UNENROLL se omite si la unidad está en el export y el usuario no está inscrito en ella.
+      - huerfanos() genera UNENROLL para quien está inscrito en el curso con el rol del flujo
+        pero no aparece en el listado de Banner del curso (NRC/LISTA_CRUZADA).
+    """
+
+    def __init__(self, inscripciones, permitir_huerfanos=True):
+        self.permitir_huerfanos = permitir_huerfanos
+        self.omitidas = 0
+        self.huerfanos_emitidos = 0
+        self._tuplas = set(zip(inscripciones['UserName'], inscripciones['OrgUnitCode'], inscripciones['RoleName']))
+        self._miembros = inscripciones.groupby('OrgUnitCode')['UserName'].agg(set).to_dict()
+        self._por_rol = inscripciones.groupby(['OrgUnitCode', 'RoleName'])['UserName'].agg(set).to_dict()
+
+    def filtrar(self, lineas):
+        """Devuelve las lineas sin los ENROLL ya vigentes ni los UNENROLL de usuarios no inscritos."""
+        salida = []
+        for linea in lineas:
+            campos = linea.split(',')
+            if campos[0] == 'ENROLL' and (campos[1], campos[4], campos[3]) in self._tuplas:
+                self.omitidas += 1
+                continue
+            if campos[0] == 'UNENROLL' and campos[3] in self._miembros and campos[1] not in self._miembros[campos[3]]:
+                self.omitidas += 1
+                continue
+            salida.append(linea)
+        return salida
+
+    def huerfanos(self, course_name, roster, rol):
+        """
+        UNENROLL de los usuarios inscritos en course_name con el rol indicado que no están en roster
+        (IDs del listado de Banner del curso). No se generan si el listado está vacío o si los
+        huérfanos están deshabilitados (fecha de corte: el listado de Banner es parcial).
+        """
+        roster = set(roster)
+        if not self.permitir_huerfanos or not roster:
+            return []
+        retirados = sorted(self._por_rol.get((course_name, rol), set()) - roster)
+        self.huerfanos_emitidos += len(retirados)
+        return [f'UNENROLL,{usuario},,{course_name}' for usuario in retirados]
+
+    def resumen(self):
+        print(f"[OK] Conciliación con Brightspace: {self.omitidas} lineas ya aplicadas omitidas, "
+              f"{self.huerfanos_emitidos} UNENROLL de inscritos ausentes en Banner.")
+
+#Lee el export de inscripciones de Brightspace (config "inscripciones_bs_file"), .csv o .xlsx
+def leer_inscripciones_bs(unidades=None, permitir_huerfanos=True):
+    """
+    Retorna un ReconciliacionBS o None si la llave no está configurada o el archivo no se puede leer.
+    unidades: códigos de unidad a conservar (cursos de shortnames.csv + unidades de arquetipo) para
+    no mantener en memoria el export completo de la institución.
+    """
+    ruta = CONFIG.get('inscripciones_bs_file')
+    if not ruta:
+        return None
+    ruta = _resolve_path(ruta, ruta)
+
+    try:
+        if ruta.lower().endswith('.csv'):
+            df = pd.read_csv(ruta, usecols=COLUMNAS_INSCRIPCIONES_BS, dtype=str, encoding='utf-8-sig')
+        else:
+            df = pd.read_excel(ruta, usecols=COLUMNAS_INSCRIPCIONES_BS, dtype=str)
+    except Exception as e:
+        print(f"[WARN] No se pudo leer el export de inscripciones '{ruta}' ({e}); se continúa sin conciliación.")
+        return None
+
+    df = df.dropna(subset=COLUMNAS_INSCRIPCIONES_BS)
+    df['UserName'] = df['UserName'].str.strip().str.zfill(9)
+    df['OrgUnitCode'] = df['OrgUnitCode'].str.strip()
+    df['RoleName'] = df['RoleName'].str.strip()
+    if unidades is not None:
+        df = df[df['OrgUnitCode'].isin(set(unidades))]
+
+    print(f"[OK] Export de inscripciones de Brightspace '{ruta}' cargado con {len(df)} inscripciones.")
+    return ReconciliacionBS(df, permitir_huerfanos)
@@ -5,7 +5,11 @@ import pandas as pd
 from datetime import datetime
 import os
 import csv
+import numpy as np
 import warnings
+from helperscomunV2 import (UserDirectory, RegistroUsuarios, particionar_cursos, formatear_documentos, ingerir_banner,
+                            merge_registros, SalidaUnica, derivar_registros_cursos, DeltaEjecucion,
+                            MAPEO_ROLES_ARQUETIPO, leer_inscripciones_bs, _resolve_path)
 warnings.filterwarnings("ignore", category=UserWarning, module="openpyxl.styles.stylesheet") # Para evitar advertencias de openpyxl: Excel no contiene un "estilo por defecto" definido en sus metadatos
 
 # Cargar configuración desde JSON - directorio es (opcional). Si no existe, se usan valores por defecto.
@@ -40,6 +44,35 @@ def load_config(path="config.json"):
 # Cargar la configuración global una sola vez, los directorios y archivos de origen de datos y salida
 CONFIG = load_config()
 
+# Archivo de salida con los comandos CREATE/UPDATE/arquetipo únicos de la ejecución (va primero en el merge)
+ARCHIVO_USUARIOS = 'registro_usuarios_Est.txt'
+ARCHIVO_UNICO = 'registro_unicoEst.txt'
+ARCHIVO_INDICE = 'indice_registro_unicoEst.csv'
+
+# Tipo_proceso = "Todos": una sola ingesta y partición genera las tres operaciones, cada una en su propia salida
+OPERACIONES = ['Matricular', 'Desmatricular', 'Limpieza']
+
+#
+#Operaciones de la ejecución: [None] para la operación única de Tipo_proceso, o las tres si es "Todos"
+def operaciones_proceso():
+    if CONFIG.get('Tipo_proceso', 'Matricular') == 'Todos':
+        return list(OPERACIONES)
+    return [None]
+
+#
+#Rutas de salida de una operación: (directorio por curso, consolidado, índice, resumen de inscritos)
+def _rutas_operacion(operacion=None):
+    '''
+    Con operacion=None (una operación por ejecución) se usan las rutas de siempre. En modo "Todos"
+    cada operación escribe en <salida_directory>/<operacion>/, registro_unicoEst_<operacion>.txt,
+    indice_registro_unicoEst_<operacion>.csv y students_<operacion>.csv.
+    '''
+    directory = CONFIG.get('salida_directory', './salida/') #directorio de salida desde el JSON de configuracion
+    if operacion is None:
+        return directory, ARCHIVO_UNICO, ARCHIVO_INDICE, 'students.csv'
+    return (os.path.join(directory, operacion, ''), f'registro_unicoEst_{operacion}.txt',
+            f'indice_registro_unicoEst_{operacion}.csv', f'students_{operacion}.csv')
+
 #
 #leer el archivo shortnames.csv con NRC/LC: CSV
 def leer_nrc():
@@ -83,25 +116,75 @@ def leer_nrc():
 
 #
 #Generar el archivo de registro unico (resumen)
-def merge_archivos():
-    # Usar la ruta de salida desde la configuración si está definida
+def merge_archivos(operacion=None):
+    # Usar la ruta de salida desde la configuración si está definida (subcarpeta de la operación en modo "Todos")
     base = os.path.dirname(os.path.abspath(__file__))
-    directory = CONFIG.get('salida_directory', './salida/')
+    directory, archivo_unico, _, _ = _rutas_operacion(operacion)
 
     if not os.path.isabs(directory):
         directory = os.path.join(base, directory)
 
-    # iteramos sobre los .txt
-    for filename in os.listdir(directory):
-        if filename.endswith('.txt'):
-            with open(directory + filename, encoding='utf8') as fp:
-                data = fp.read()
-
-            with open('registro_unicoEst.txt', 'a', encoding='utf8') as fp:
-                fp.write(data)            
+    # primero los comandos a nivel de usuario (CREATE/UPDATE/arquetipo), luego los .txt de cada curso en orden alfabético
+    merge_registros(directory, archivo_unico, ARCHIVO_USUARIOS)
 
     return
 
+#
+#Escribe en la salida los comandos a nivel de usuario de toda la ejecución (una linea por usuario/unidad)
+def guardar_registro_usuarios(registro, operacion=None):
+    if not len(registro):
+        return
+    directory = _rutas_operacion(operacion)[0]
+    os.makedirs(directory, exist_ok=True)
+    registro.escribir(directory + ARCHIVO_USUARIOS)
+    print(f"\n[✓] Comandos de usuario: {len(registro)} lineas únicas ({registro.omitidas} repetidas omitidas) en {ARCHIVO_USUARIOS}")
+
+#
+#Salida única (config "salida_modo": "unico"): los cursos se escriben directo al consolidado, sin merge
+def crear_salida(operacion=None):
+    '''
+    Devuelve un SalidaUnica sobre registro_unicoEst.txt (o el de la operación) si salida_modo es "unico";
+    None en el modo por defecto ("por_curso": un registro_<curso>.txt por curso + merge_archivos).
+    '''
+    if CONFIG.get('salida_modo', 'por_curso') != 'unico':
+        return None
+    _, archivo_unico, archivo_indice, _ = _rutas_operacion(operacion)
+    return SalidaUnica(archivo_unico, archivo_indice, ARCHIVO_USUARIOS)
+
+#
+#Modo delta (config "modo_delta"): filtro contra el snapshot de la ejecución anterior del flujo de estudiantes
+def crear_delta(fecha_corte=None):
+    '''
+    Devuelve un DeltaEjecucion sobre <delta_directorio>/snapshot_Est.pkl si modo_delta está activo, si no None.
+    Las bajas (delta_bajas) solo se calculan al Matricular (también en "Todos") y sin fecha de corte:
+    con listados parciales de Banner cualquier estudiante ausente se desmatricularía por error.
+    '''
+    if not CONFIG.get('modo_delta', False):
+        return None
+    permitir_bajas = (CONFIG.get('delta_bajas', False)
+                      and CONFIG.get('Tipo_proceso', 'Matricular') in ('Matricular', 'Todos')
+                      and fecha_corte is None)
+    ruta = os.path.join(_resolve_path(CONFIG.get('delta_directorio', './delta/'), './delta/'), 'snapshot_Est.pkl')
+    return DeltaEjecucion(ruta, permitir_bajas)
+
+#
+#Conciliación (config "inscripciones_bs_file") contra el export de inscripciones de Brightspace
+def crear_reconciliacion(cursos, fecha_corte=None):
+    '''
+    Devuelve un ReconciliacionBS limitado a los cursos de shortnames.csv y a las unidades de arquetipo,
+    o None si no hay export configurado. Los UNENROLL de inscritos ausentes en Banner (rol Student)
+    solo se generan sin fecha de corte y en la operación Desmatricular (ver crearArchivos).
+    '''
+    unidades = list(cursos['Nombre'].astype(str)) + ['UPBV'] + list(MAPEO_ROLES_ARQUETIPO['OrgUnidArquetipo'].unique())
+    return leer_inscripciones_bs(unidades, permitir_huerfanos=fecha_corte is None)
+
+#
+#Regenera en salida_directory los registro_<curso>.txt de la última ejecución en modo "unico"
+def derivar_registros(archivos=None, operacion=None):
+    directory, archivo_unico, archivo_indice, _ = _rutas_operacion(operacion)
+    consolidado = archivo_unico + '.gz' if CONFIG.get('merge_gzip', False) else archivo_unico
+    return derivar_registros_cursos(consolidado, archivo_indice, directory, archivos)
+
 #
 #Leer la BD de estudiantes de BS: XLSX - Origen BS INSIGHT
 def leer_BDUsuarios_BS(ruta_archivo=None):
@@ -130,10 +213,22 @@ def leer_BDUsuarios_BS(ruta_archivo=None):
             sheet_name=0,        # Leer la primera hoja
         )
 
-        #Se promueven las columnas necesarias
+        #Se promueven las columnas necesarias (rol y datos de contacto se usan en el UserDirectory)
+        columnas_necesarias = ['UserName', 'FirstName', 'LastName', 'OrgRoleId', 'OrgDefinedId', 'ExternalEmail']
+        for col in columnas_necesarias:
+            if col not in df.columns:
+                df[col] = ''
+
+        # IsActive (si viene en el export) se conserva para decidir si un UPDATE sin cambios se puede omitir
+        if 'IsActive' in df.columns:
+            columnas_necesarias.append('IsActive')
+
         # Asegurar que los valores sean cadenas de texto y completar con ceros a la izquierda, se asume la longitud de 9
-        df=df[['UserName', 'FirstName', 'LastName']]
+        df=df[columnas_necesarias]
         df['UserName'] = df['UserName'].astype(str).str.zfill(9)
+        df['OrgRoleId'] = df['OrgRoleId'].astype(str).str.strip()
+        df['OrgDefinedId'] = df['OrgDefinedId'].fillna('').astype(str).str.strip()
+        df['ExternalEmail'] = df['ExternalEmail'].fillna('').astype(str).str.strip()
         
         print(f"[✓] Archivo '{ruta_archivo}' cargado exitosamente.")
         print(f"El archivo contiene {df.shape[0]} filas y {df.shape[1]} columnas.")
@@ -153,6 +248,8 @@ def leer_estudiantesBanner(date='nodate'):
     """
     Lee múltiples archivos .xlsx con información de estudiantes desde el directorio origen o actual.
     Optimizado para grandes volúmenes. Aplica limpieza y validación.
+    La lectura usa la capa de ingesta compartida (helperscomunV2.ingerir_banner): cada libro
+    se abre una sola vez y las hojas ya limpias se guardan en la cache de Banner.
     
     Parámetros:
         date (str): Fecha mínima (YYYY-MM-DD) para filtrar la columna 'FECHA_ACTIVIDAD_EST'.
@@ -160,207 +257,183 @@ def leer_estudiantesBanner(date='nodate'):
     Retorna:
         pd.DataFrame consolidado.
     """
-    
-    # Directorio con archivos .xlsx — puede definirse en config.json
-    base = os.path.dirname(os.path.abspath(__file__))
-    directory = CONFIG.get('banner_directory', './')
-    if not os.path.isabs(directory):
-        directory = os.path.join(base, directory)
-
-    # Validación de existencia del directorio
-    if not os.path.isdir(directory):
-        raise FileNotFoundError(f"❌ No se encontró el directorio de archivos .xlsx: {directory}")
-
-    excel_files = [f for f in os.listdir(directory) if f.endswith(".xlsx")]
-
-    # Validación de archivos excel en el directorio
-    if not excel_files:
-        raise FileNotFoundError("❌ No se encontró ningún archivo .xlsx en el directorio actual.")
-
-    # Definición de solo las columnas necesarias para optimizar la carga del excel
-    columnas_objetivo = {
-        'PERIODO', 'NRC', 'LISTA_CRUZADA', 'ID_ESTUDIANTE', 'TIPO_DOCUMENTO',
-        'DOCUMENTO', 'CORREO_ESTUDIANTE', 'NOMBRE_ESTUDIANTE','APELLIDO_ESTUDIANTE', 
-        'COD_INSCRIPCIÓN', 'ESTADO_INSCRIPCIÓN', 'FECHA_ACTIVIDAD_EST', "PAGO", "SOCIO_INTEGRADOR"
-    }
-    dataframes = []
-
-    # Iterar sobre cada archivo Excel
-    for file in excel_files:
-        filepath = os.path.join(directory, file)
-        print(f"📥 Leyendo archivo: {filepath}")
-
-        try:
-            # Cargar todo el archivo
-            df = pd.read_excel(filepath, 
-                               sheet_name=1,  # Segunda hoja (estudiantes)
-                               dtype={'ID_ESTUDIANTE': str},
-                               engine='openpyxl'
-                )      
-        except Exception as e:
-            print(f"❌ Error al leer el archivo {file}: {e}")
-            continue
-
-        # Validar columnas requeridas existan en el excel
-        if not columnas_objetivo.issubset(set(df.columns)):
-            faltantes = columnas_objetivo - set(df.columns)
-            print(f"⚠️ Advertencia: El archivo {file} no tiene todas las columnas requeridas: {faltantes}")
-            continue
-
-        # Filtrar solo las columnas necesarias
-        df = df[list(columnas_objetivo)]
-
-        # Limpieza y transformación de datos :espacios, tipos de datos y tipo titulo
-        df['ID_ESTUDIANTE'] = df['ID_ESTUDIANTE'].astype(str).str.zfill(9)
-        df['LISTA_CRUZADA'] = df['LISTA_CRUZADA'].astype(str)
-        df['COD_INSCRIPCIÓN'] = df['COD_INSCRIPCIÓN'].astype(str)
-        df['ESTADO_INSCRIPCIÓN'] = df['ESTADO_INSCRIPCIÓN'].astype(str)
-        df['NOMBRE_ESTUDIANTE'] = df['NOMBRE_ESTUDIANTE'].astype(str).str.strip().str.title()
-        df['APELLIDO_ESTUDIANTE'] = df['APELLIDO_ESTUDIANTE'].astype(str).str.strip().str.title()
-        df['SOCIO_INTEGRADOR'] = df['SOCIO_INTEGRADOR'].astype(str).str.strip() #socio integrador
-        df['PAGO'] = df['PAGO'].astype(str)                                     #pago Y/N
-
-        #se verifica que las columnas de fecha y periodo existan
-        try:
-            df['FECHA_ACTIVIDAD_EST'] = pd.to_datetime(df['FECHA_ACTIVIDAD_EST'], errors='coerce')
-            if date != 'nodate':
-                df = df[df['FECHA_ACTIVIDAD_EST'] >= pd.to_datetime(date)]
-        except Exception as e:
-            print(f"❌ Error al procesar fechas en {file}: {e}")
-            continue
-
-        dataframes.append(df)
-
-    if not dataframes:
-        raise ValueError("❌ Ningún archivo válido fue procesado correctamente.")
-
-    # Concatenar todos los DataFrames en uno solo
-    resultado = pd.concat(dataframes, ignore_index=True)
-    
-    #retornar el DataFrame consolidado
-    return resultado
+    return ingerir_banner(['estudiantes'], date)['estudiantes']
 
 #
-#Se crea el archivo de registro para cada curso NRC/LC
-def crearArchivos(data, course_name, course_nrc, course_periodo, BDEstuBS):
-    '''
-    Función que recibe como entrada un dataframe del archivo de Excel leído, y el nombre del curso.
-    No devuelve ningún valor.
-    Recorre las filas del dataframe, y genera los comandos para la creación y registro de usuarios en Brightspace.
-    '''
-      
-    # se evalua que tipo de proceso x defecto es Matricular
-    tipproceso = CONFIG.get('Tipo_proceso', 'Matricular')
-    
-    #se evalua el tipo de formacion a inscribir
-    #FA, PR, EX y TE 
+#Rol y unidad organizacional (arquetipo) segun el tipo de formacion del periodo
+def rol_formacion(course_periodo):
+    """
+    Devuelve la tupla (Rol, OrgUnid) según los dos últimos dígitos del periodo:
+    FA (41, 42), PR (10, 11, 20, 21), EX (50) y TE (17, 27, 37).
+    Si el tipo de formación no se reconoce devuelve (None, None).
+    """
     tipformacion = str(course_periodo)[-2:]
 
     if tipformacion in ["41", "42"]:                #formacion avanzada
-          Rol = "Student_fa"
-          OrgUnid = "CVFA"
+        return "Student_fa", "CVFA"
     elif tipformacion in ["10", "11", "20", "21"]: #formacion pregrado
-          Rol = "Student_pr"
-          OrgUnid = "CVPR"
+        return "Student_pr", "CVPR"
     elif (tipformacion == "50"):                    #formacion continua
-          Rol = "Student_ex"
-          OrgUnid = "CVFC"
+        return "Student_ex", "CVFC"
     elif tipformacion in ["17", "27", "37"]:        #formacion tecnologica
-          Rol = "Student_te"
-          OrgUnid = "CVTE"
-  
-    # Creamos los archivos distintos por curso
-    directory = CONFIG.get('salida_directory', './salida/') #directorio de salida desde el JSON de configuracion
-    file    = directory + 'registro_' + course_name + '.txt'
-    fptr    = open(file, 'a', encoding='utf8')
-    line_count = 0
- 
-    # Ciclo para recorrer el dataframe - estudiantes Banner
-    for index, row in data.iterrows():
+        return "Student_te", "CVTE"
+    return None, None
 
-        ###Guardar los datos que necesitamos en variables
+#
+#Estudiantes cuyo UNENROLL del curso ya emite Desmatricular/Limpieza en modo "Todos" (sin baja delta repetida)
+def _bajas_por_estado(data, operacion):
+    if operacion != 'Matricular' or data.empty:
+        return set()
+    return set(data.loc[data['ESTADO_INSCRIPCIÓN'].isin(['Cancelado', 'Eliminado']), 'ID_ESTUDIANTE'])
 
-        #ID_Estudiante
-        idBanner       = row['ID_ESTUDIANTE']
-        
-        # Verificar si el idBanner existe en la base de estudiantes BS
-        Enuevo = idBanner not in BDEstuBS['UserName'].values
-
-        #tipo documento + numero documento
-        try:
-             ndocu = "{:,}".format(int(row['DOCUMENTO'])).replace(',', '.')  #Formatear con separador de miles
-        except:
-             ndocu = row['DOCUMENTO']                                        # Si hay un error, deja el valor original
-
-        try:
-             docuusu     = row['TIPO_DOCUMENTO']+". "+ndocu                  #se concatena el tipo de documento con el numero
-        except:
-             docuusu     = ndocu                                             #Si hay un error, se deja solo el numero
-
-        #nombre y apellidos del estudiante.
-        first_name  = row['NOMBRE_ESTUDIANTE']
-        last_name   = row['APELLIDO_ESTUDIANTE']
-
-        #correo principal del estudiante
-        email       = row['CORREO_ESTUDIANTE']
-        
-        #ESTADO_INSCRIPCIÓN
-        estado = row['ESTADO_INSCRIPCIÓN']
+#
+#Genera los comandos de un curso NRC/LC por columnas (sin recorrer fila a fila)
+def generar_comandos(data, course_name, course_periodo, directorio_usuarios, tipproceso, registro=None):
+    """
+    Motor vectorizado de comandos para Brightspace: cada columna del comando (documento,
+    rol, unidad organizacional, compuerta de pago APLATAM, CREATE/UPDATE/ENROLL/UNENROLL)
+    se calcula sobre todo el listado del curso de una sola vez.
+
+    Si se recibe un RegistroUsuarios, las lineas CREATE/UPDATE y ENROLL de arquetipo se
+    registran ahí (una sola vez por ejecución) y solo se devuelven las inscripciones al curso.
+
+    Retorna:
+        (lineas, line_count): lista de lineas en el mismo orden del listado y numero de estudiantes procesados.
+    """
+    if data.empty:
+        return [], 0
+
+    estado = data['ESTADO_INSCRIPCIÓN']
+    ids = data['ID_ESTUDIANTE']
+
+    #Proceso de desmatriculacion (Cancelado) o Limpieza (Eliminado)
+    if tipproceso in ('Desmatricular', 'Limpieza'):
+        estado_objetivo = 'Cancelado' if tipproceso == 'Desmatricular' else 'Eliminado'
+        sel = (estado == estado_objetivo).to_numpy()
+        lineas = ('UNENROLL,' + ids[sel] + ',,' + course_name).tolist()
+        return lineas, len(lineas)
+
+    if tipproceso != 'Matricular':
+        return [], 0
+
+    Rol, OrgUnid = rol_formacion(course_periodo)
+    if Rol is None:
+        print(f"⚠️ Advertencia: Tipo de formación no reconocido para el periodo {course_periodo} del curso {course_name}")
+        return [], 0
+
+    #validar socio integrador : Si es APLATAM o BS (UPBVIRTUAL). Si no tiene socio integrador, se asume BS
+    socio = data['SOCIO_INTEGRADOR'].mask(data['SOCIO_INTEGRADOR'] == "nan", "BS")
+    pago = data['PAGO']
+
+    # Solo se inscribe si esta Inscrito (BANNER|SZREINS) y es BS o es APLATAM y ha pagado
+    sel = ((estado == 'Inscrito') & ((socio == "BS") | ((socio == "AP") & (pago == "Y")))).to_numpy()
+    if not sel.any():
+        return [], 0
+
+    datos = data[sel]
+    ids = datos['ID_ESTUDIANTE']
+
+    #se valida el caso de "APLATAM" en formacion avanzada
+    rol = pd.Series(Rol, index=datos.index)
+    orgunid = pd.Series(OrgUnid, index=datos.index)
+    if str(course_periodo)[-2:] in ["41", "42"]:
+        es_ap = socio[sel] == "AP"
+        rol = rol.mask(es_ap, "Student_ap")
+        orgunid = orgunid.mask(es_ap, "CVLA")
+
+    #tipo documento + numero documento (si el tipo no es texto se deja solo el numero)
+    ndocu = formatear_documentos(datos['DOCUMENTO'])
+    tipo = datos['TIPO_DOCUMENTO']
+    tipo_valido = tipo.map(lambda valor: isinstance(valor, str))
+    docuusu = ndocu.mask(tipo_valido, tipo.astype(str) + ". " + ndocu)
+
+    datos_usuario = docuusu + ',' + datos['NOMBRE_ESTUDIANTE'] + ',' + datos['APELLIDO_ESTUDIANTE'] + ',,'
+    email = datos['CORREO_ESTUDIANTE'].astype(str)
+
+    # Verificar si el idBanner existe en la base de estudiantes BS (búsqueda por hash en el directorio)
+    nuevo = ~directorio_usuarios.existen(ids).to_numpy()
+
+    #Usuario nuevo: CREATE + inscripcion en la Unidad (nivel de formacion) para la pagina de inicio
+    #Usuario existente: UPDATE (SE ACTIVA EL USUARIO) + inscripcion en la Unidad UPBV - CAMBIO ROL ARQUETIPO
+    #Usuario existente, activo y con los mismos datos en BS: el UPDATE no cambia nada y se omite
+    sin_cambios = np.zeros(len(datos), dtype=bool)
+    if CONFIG.get('omitir_update_sin_cambios', True):
+        sin_cambios = ~nuevo & directorio_usuarios.sin_cambios(
+            ids, docuusu, datos['NOMBRE_ESTUDIANTE'], datos['APELLIDO_ESTUDIANTE'], email)
+
+    linea_usuario = np.where(nuevo,
+                             'CREATE,' + ids + ',' + datos_usuario + rol + ',1,' + email,
+                             np.where(sin_cambios, '', 'UPDATE,' + ids + ',' + datos_usuario + '1,' + email))
+    #Usuario existente que ya tiene ese rol de arquetipo en BS (OrgRoleId): no se repite el ENROLL en UPBV
+    rol_vigente = ~nuevo & directorio_usuarios.tienen_rol(ids, rol)
+    linea_arquetipo = np.where(nuevo,
+                               'ENROLL,' + ids + ',,' + rol + ',' + orgunid,
+                               np.where(rol_vigente, '', 'ENROLL,' + ids + ',,' + rol + ',UPBV'))
+    #Inscripcion en el curso
+    linea_curso = ('ENROLL,' + ids + ',,Student,' + course_name).to_numpy()
+
+    if registro is not None:
+        lineas_usuario = np.column_stack([linea_usuario, linea_arquetipo]).ravel()
+        registro.registrar(lineas_usuario[lineas_usuario != ''].tolist())
+        return linea_curso.tolist(), len(datos)
+
+    # Se intercalan las lineas de cada estudiante conservando el orden del listado y se descartan las vacias
+    lineas = np.column_stack([linea_usuario, linea_arquetipo, linea_curso]).ravel()
+    return lineas[lineas != ''].tolist(), len(datos)
+
+#
+#Se crea el archivo de registro para cada curso NRC/LC
+def crearArchivos(data, course_name, course_nrc, course_periodo, directorio_usuarios, registro=None, salida=None,
+                  delta=None, reconciliacion=None, operacion=None):
+    '''
+    Función que recibe como entrada un dataframe del archivo de Excel leído, y el nombre del curso.
+    directorio_usuarios es el UserDirectory construido una sola vez desde BDUsuarios.
+    registro (RegistroUsuarios, opcional) acumula los comandos a nivel de usuario de toda la ejecución.
+    salida (SalidaUnica, opcional) recibe las lineas del curso en lugar del archivo registro_<curso>.txt.
+    delta (DeltaEjecucion, opcional) deja solo los cambios respecto al snapshot de la ejecución anterior.
+    reconciliacion (ReconciliacionBS, opcional) concilia contra el export de inscripciones de Brightspace.
+    operacion (str, opcional) Matricular/Desmatricular/Limpieza en modo "Todos"; si no, se usa Tipo_proceso.
+    No devuelve ningún valor.
+    Genera por columnas los comandos para la creación y registro de usuarios en Brightspace
+    y los escribe en el archivo del curso en una sola escritura.
+    '''
+      
+    # se evalua que tipo de proceso x defecto es Matricular (en modo "Todos" llega la operación)
+    tipproceso = operacion if operacion is not None else CONFIG.get('Tipo_proceso', 'Matricular')
+    directory, _, _, archivo_resumen = _rutas_operacion(operacion)
 
-        #ESTUDIANTE PAGO
-        pago = row['PAGO']
+    lineas, line_count = generar_comandos(data, course_name, course_periodo, directorio_usuarios, tipproceso, registro)
   
-        #validar socio integrador : Si es APLATAM o BS (UPBVIRTUAL)
-        socio_integrador = row['SOCIO_INTEGRADOR']
-        if socio_integrador == "nan" : socio_integrador = "BS"  # Si no tiene socio integrador, se asume BS
-    
-        #se valida el caso de "APLATAM" en formacion avanzada
-        if tipformacion in ["41", "42"]:
-            if socio_integrador == "AP":
-                Rol = "Student_ap"
-                OrgUnid = "CVLA"
-            else:
-                Rol = "Student_fa"
-                OrgUnid = "CVFA"
-               
-        #Proceso de inscripcion o cancelacion
-        if(tipproceso == 'Matricular'): #Definido en el JSON de configuracion
-            if(estado == 'Inscrito'):   #Se procede a la inscripcion - BANNER|SZREINS
-                if (socio_integrador == "BS") or (socio_integrador == "AP" and pago == "Y") :  # Solo se inscribe si es APLATAM y ha pagado o si es BS
-                    
-                    if Enuevo: ##si el estudiante no existe en la base de datos de estudiantes BS SE crea el usuario
-                        fptr.write('CREATE' + ',' + idBanner + ',' + docuusu + ',' + first_name + ',' + last_name+ ',,' + Rol + ',' + '1' + ',' + email + '\n')
-                        # Generamos la inscripción  en la Unidad (nivel de formacion) para la pagina de inicio
-                        fptr.write('ENROLL' + ',' + idBanner + ',' + '' + ',' + Rol + ',' + OrgUnid + '\n')
-                    else: ##si el estudiante ya existe en la base de datos de estudiantes BS SE actualiza el usuario
-                        # Generamos la actualización de los datos del usuario y SE ACTIVA EL USUARIO
-                        fptr.write('UPDATE' + ',' + idBanner + ',' + docuusu + ',' + first_name + ',' + last_name+ ',,' + '1' + ',' + email + '\n')
-                        # Generamos la inscripción  en la Unidad UPBV - CAMBIO ROL ARQUETIPO
-                        fptr.write('ENROLL' + ',' + idBanner + ',' + '' + ',' + Rol + ',' + "UPBV" + '\n')
-
-                    # Generamos las lineas al archivo para inscripción en el curso
-                    fptr.write('ENROLL' + ',' + idBanner + ',' + '' + ',' + 'Student' +',' + course_name + '\n')
-
-                    line_count = line_count + 1
-        #Proceso de desmatriculacion o Limpieza
-        else:
-            #print("\n[→] Limpiando estudiante ID_Banner: " + idBanner + " del curso: " + course_name + " NRC: " + course_nrc)
-            if ((tipproceso == 'Desmatricular') and (estado == 'Cancelado')): ##si hay cancelacion se procede a la desmatriculacion
-                fptr.write('UNENROLL' + ',' + idBanner + ',' +',' + course_name + '\n')
-                line_count = line_count + 1
-            elif ((tipproceso == 'Limpieza') and (estado == 'Eliminado')): ##si hay eliminacion se procede a la desmatriculacion
-                  # Generamos los registros para desmatricular al estudiante - LIMPIEZA DE LISTA (DL)            
-                  fptr.write('UNENROLL' + ',' + idBanner + ',' +',' + course_name + '\n')
-                  line_count = line_count + 1
+    # Modo delta: solo inscripciones nuevas (y bajas del curso si están habilitadas). Se calcula antes de
+    # conciliar: el snapshot y las bajas deben ver también los ENROLL que ya están vigentes en Brightspace
+    if delta is not None:
+        lineas = delta.filtrar_curso(course_name, lineas, _bajas_por_estado(data, operacion))
+
+    # Conciliación con Brightspace: sin ENROLL ya vigentes, UNENROLL de inscritos que no están en Banner
+    if reconciliacion is not None:
+        lineas = reconciliacion.filtrar(lineas)
+        if tipproceso == 'Desmatricular':
+            huerfanos = reconciliacion.huerfanos(course_name, data['ID_ESTUDIANTE'], 'Student')
+            if delta is not None:
+                huerfanos = delta.filtrar(huerfanos)
+            emitidas = set(lineas)
+            lineas += [linea for linea in huerfanos if linea not in emitidas]
+
+    # Creamos los archivos distintos por curso (o la sección del curso en el consolidado)
+    if salida is not None:
+        salida.escribir_curso(course_name, lineas)
+    else:
+        if operacion is not None:
+            os.makedirs(directory, exist_ok=True)
+        file    = directory + 'registro_' + course_name + '.txt'
+        with open(file, 'a', encoding='utf8') as fptr:
+            fptr.write(''.join(linea + '\n' for linea in lineas))
     
     # Generamos el archivo resumen de inscritos por curso
     numberStudents = [course_name, course_nrc, line_count]
-    estudiantes = open('students.csv', 'a', encoding='utf8')
-    writer = csv.writer(estudiantes)
-    writer.writerow(numberStudents)
-
-    print("\n[✓] Se han inscrito:" + str(line_count) + " estudiantes en el curso:" + course_name + " NRC:" + course_nrc)
+    with open(archivo_resumen, 'a', encoding='utf8') as estudiantes:
+        writer = csv.writer(estudiantes)
+        writer.writerow(numberStudents)
 
-    # Cerramos los archivos
-    fptr.close()
-    estudiantes.close()    
\ No newline at end of file
+    prefijo = "[" + operacion + "] " if operacion is not None else ""
+    print("\n[✓] " + prefijo + "Se han inscrito:" + str(line_count) + " estudiantes en el curso:" + course_name + " NRC:" + course_nrc)
@@ -4,7 +4,11 @@ import pandas as pd
 from datetime import datetime
 import os
 import csv
+import numpy as np
 import warnings
+from helperscomunV2 import (UserDirectory, RegistroUsuarios, particionar_cursos, formatear_documentos, ingerir_banner,
+                            merge_registros, SalidaUnica, derivar_registros_cursos, DeltaEjecucion,
+                            MAPEO_ROLES_ARQUETIPO, leer_inscripciones_bs)
 warnings.filterwarnings("ignore", category=UserWarning, module="openpyxl.styles.stylesheet") # Para evitar advertencias de openpyxl: Excel no contiene un "estilo por defecto" definido en sus metadatos
 
 # Cargar configuración desde JSON - directorio es (opcional). Si no existe, se usan valores por defecto.
@@ -42,6 +46,11 @@ def load_config(path="config.json"):
 # Cargar la configuración global una sola vez, los directorios y archivos de origen de datos y salida
 CONFIG = load_config()
 
+# Archivo de salida con los comandos CREATE/UPDATE/arquetipo únicos de la ejecución (va primero en el merge)
+ARCHIVO_USUARIOS = 'registro_usuarios_MOD.txt'
+ARCHIVO_UNICO = 'registro_unicoMOD.txt'
+ARCHIVO_INDICE = 'indice_registro_unicoMOD.csv'
+
 INVALID_IDS = {"000000nan", "nan", "", "0", "-", "000000000", "none"}
 
 # Funciones auxiliares comunes para la lectura de archivos, limpieza de datos, resolución de coordinadores y creación de archivos de inscripción.
@@ -70,6 +79,17 @@ def _normalizar_id_banner(value):
 
     return valor.zfill(9)
 
+# Versión por columna de _normalizar_id_banner: recibe una Serie de IDs y devuelve una Serie de textos.
+def _normalizar_ids_banner(serie):
+    valores = serie.astype(object)
+    valores = valores.where(valores.notna(), '').astype(str).str.strip().str.lower()
+    valores = valores.mask(valores.isin(['nan', 'none']), '')
+
+    # Si llega como float por Excel (ej: 138144.0) se limpia el decimal.
+    valores = valores.str.replace(r'\.0$', '', regex=True)
+
+    return valores.where(valores == '', valores.str.zfill(9))
+
 #leer el archivo de NRC/LC: CSV
 def leer_nrc():
     """
@@ -118,17 +138,57 @@ def merge_archivos():
     if not os.path.isabs(directory):
         directory = os.path.join(base, directory)
 
-    # iteramos sobre los .txt
-    for filename in os.listdir(directory):
-        if filename.endswith('.txt'):
-            with open(directory + filename, encoding='utf8') as fp:
-                data = fp.read()
-
-            with open('registro_unicoMOD.txt', 'a', encoding='utf8') as fp:
-                fp.write(data)            
+    # primero los comandos a nivel de usuario (CREATE/UPDATE/arquetipo), luego los .txt de cada curso en orden alfabético
+    merge_registros(directory, ARCHIVO_UNICO, ARCHIVO_USUARIOS)
 
     return
 
+#Escribe en la salida los comandos a nivel de usuario de toda la ejecución (una linea por usuario/unidad)
+def guardar_registro_usuarios(registro):
+    if not len(registro):
+        return
+    directory = _resolve_path(CONFIG.get('salida_directory', './salida/'), './salida/')
+    os.makedirs(directory, exist_ok=True)
+    registro.escribir(os.path.join(directory, ARCHIVO_USUARIOS))
+    print(f"[OK] Comandos de usuario: {len(registro)} lineas únicas ({registro.omitidas} repetidas omitidas) en {ARCHIVO_USUARIOS}")
+
+#Salida única (config "salida_modo": "unico"): los cursos se escriben directo al consolidado, sin merge
+def crear_salida():
+    """
+    Devuelve un SalidaUnica sobre registro_unicoMOD.txt si salida_modo es "unico";
+    None en el modo por defecto ("por_curso": un registro_<curso>.txt por curso + merge_archivos).
+    """
+    if CONFIG.get('salida_modo', 'por_curso') != 'unico':
+        return None
+    return SalidaUnica(ARCHIVO_UNICO, ARCHIVO_INDICE, ARCHIVO_USUARIOS)
+
+#Modo delta (config "modo_delta"): filtro contra el snapshot de la ejecución anterior del flujo de docentes
+def crear_delta(fecha_corte=None):
+    """
+    Devuelve un DeltaEjecucion sobre <delta_directorio>/snapshot_MOD.pkl si modo_delta está activo, si no None.
+    Las bajas (delta_bajas) no se calculan con fecha de corte: el listado de Banner sería parcial.
+    """
+    if not CONFIG.get('modo_delta', False):
+        return None
+    permitir_bajas = CONFIG.get('delta_bajas', False) and fecha_corte is None
+    ruta = os.path.join(_resolve_path(CONFIG.get('delta_directorio', './delta/'), './delta/'), 'snapshot_MOD.pkl')
+    return DeltaEjecucion(ruta, permitir_bajas)
+
+#Conciliación (config "inscripciones_bs_file") contra el export de inscripciones de Brightspace
+def crear_reconciliacion(cursos, fecha_corte=None):
+    """
+    Devuelve un ReconciliacionBS limitado a los cursos de shortnames.csv y a las unidades de arquetipo,
+    o None si no hay export configurado. Con fecha de corte no se generan UNENROLL de ausentes en Banner.
+    """
+    unidades = list(cursos['Nombre'].astype(str)) + ['UPBV'] + list(MAPEO_ROLES_ARQUETIPO['OrgUnidArquetipo'].unique())
+    return leer_inscripciones_bs(unidades, permitir_huerfanos=fecha_corte is None)
+
+#Regenera en salida_directory los registro_<curso>.txt de la última ejecución en modo "unico"
+def derivar_registros(archivos=None):
+    consolidado = ARCHIVO_UNICO + '.gz' if CONFIG.get('merge_gzip', False) else ARCHIVO_UNICO
+    directory = _resolve_path(CONFIG.get('salida_directory', './salida/'), './salida/')
+    return derivar_registros_cursos(consolidado, ARCHIVO_INDICE, directory, archivos)
+
 #Leer la BD de usuarios de BS: XLSX - Fuente DOMO
 def leer_BDUsuarios_BS(ruta_archivo=None):
     """
@@ -159,6 +219,10 @@ def leer_BDUsuarios_BS(ruta_archivo=None):
             if col not in df.columns:
                 df[col] = ''
 
+        # IsActive (si viene en el export) se conserva para decidir si un UPDATE sin cambios se puede omitir
+        if 'IsActive' in df.columns:
+            columnas_necesarias.append('IsActive')
+
         df = df[columnas_necesarias]
         df['UserName'] = df['UserName'].apply(_normalizar_id_banner)
         df['FirstName'] = df['FirstName'].astype(str).str.strip()
@@ -182,88 +246,25 @@ def leer_BDUsuarios_BS(ruta_archivo=None):
 #leer el archivo de moderadores a inscribir: EXCEL fuente BANNER
 def leer_moderadores(date='nodate'):
     """
-    Lee múltiples archivos .xlsx con información de estudiantes desde el directorio origen o actual.
+    Lee múltiples archivos .xlsx con información de docentes desde el directorio origen o actual.
     Optimizado para grandes volúmenes. Aplica limpieza y validación.
     
     Parámetros:
-        date (str): Fecha mínima (YYYY-MM-DD) para filtrar la columna 'FECHA_ACTIVIDAD_EST'.
+        date (str): Fecha mínima (YYYY-MM-DD) para filtrar la columna 'FECHA_ACTIVIDAD_DOC'.
     
     Retorna:
         pd.DataFrame consolidado.
     """
-    
-    # Directorio con archivos .xlsx — puede definirse en config.json
-    directory = _resolve_path(CONFIG.get('banner_directory', './'), './')
-
-    # Validación de existencia del directorio
-    if not os.path.isdir(directory):
-        raise FileNotFoundError(f"[ERROR] No se encontró el directorio de archivos .xlsx: {directory}")
-
-    excel_files = [f for f in os.listdir(directory) if f.endswith(".xlsx") and not f.startswith("~$")]
+    return ingerir_banner(['docentes'], date)['docentes']
 
-    # Validación de archivos excel en el directorio
-    if not excel_files:
-        raise FileNotFoundError("[ERROR] No se encontró ningún archivo .xlsx en el directorio actual.")
-
-    # Definición de solo las columnas necesarias para optimizar la carga del excel
-    columnas_objetivo = {
-        'PERIODO', 'NRC', 'LISTA_CRUZADA', 'ID_DOCENTE', 'TIPO_DOCUMENTO',
-        'DOCUMENTO', 'CORREO_DOCENTE', 'NOMBRE_DOCENTE', 'APELLIDO_DOCENTE',"FECHA_ACTIVIDAD_DOC"
-    }
-    dataframes = []
-
-    # Iterar sobre cada archivo Excel
-    for file in excel_files:
-        filepath = os.path.join(directory, file)
-        print(f"[INFO] Leyendo archivo: {filepath}")
-
-        try:
-            # Cargar todo el archivo
-            df = pd.read_excel(filepath, 
-                               sheet_name=0,  # primera hoja (docentes)
-                               dtype={'ID_DOCENTE': str, 'LISTA_CRUZADA': str},
-                               engine='openpyxl'
-                )    
-
-            print(f"[OK] Archivo '{file}' cargado con {df.shape[0]} filas y {df.shape[1]} columnas.")  
-        except Exception as e:
-            print(f"[ERROR] Error al leer el archivo {file}: {e}")
-            continue
-
-        # Validar columnas requeridas existan en el excel
-        if not columnas_objetivo.issubset(set(df.columns)):
-            faltantes = columnas_objetivo - set(df.columns)
-            print(f"[WARN] Advertencia: El archivo {file} no tiene todas las columnas requeridas: {faltantes}")
-            continue
-
-        # Filtrar solo las columnas necesarias
-        df = df[list(columnas_objetivo)]
-
-        # Limpieza y transformación de datos :espacios, tipos de datos y tipo titulo
-        df['ID_DOCENTE'] = df['ID_DOCENTE'].astype(str).str.zfill(9)
-        df['LISTA_CRUZADA'] = df['LISTA_CRUZADA'].astype(str)
-        df['NOMBRE_DOCENTE'] = df['NOMBRE_DOCENTE'].astype(str).str.strip().str.title()
-        df['APELLIDO_DOCENTE'] = df['APELLIDO_DOCENTE'].astype(str).str.strip().str.title()
-
-        #se verifica que las columnas de fecha y periodo existan
-        try:
-            df['FECHA_ACTIVIDAD_DOC'] = pd.to_datetime(df['FECHA_ACTIVIDAD_DOC'], errors='coerce')
-            if date != 'nodate':
-                df = df[df['FECHA_ACTIVIDAD_DOC'] >= pd.to_datetime(date)]
-        except Exception as e:
-            print(f"[ERROR] Error al procesar fechas en {file}: {e}")
-            continue
-
-        dataframes.append(df)
-
-    if not dataframes:
-        raise ValueError("[ERROR] Ningún archivo válido fue procesado correctamente.")
+#Eliminar duplicados de CENTROCOSTOSESTUDIANTE por: PERIODO, LISTA_CRUZADA, ESTADO_INSCRIPCIÓN, COD_PROGRAMA_ESTUDIANTE.
+def _consolidar_centrocostos(centro_costos_estudiante):
+    centro_costos_estudiante = centro_costos_estudiante.drop_duplicates(
+        subset=['PERIODO', 'LISTA_CRUZADA', 'ESTADO_INSCRIPCIÓN', 'COD_PROGRAMA_ESTUDIANTE']
+    ).reset_index(drop=True)
 
-    # Concatenar todos los DataFrames en uno solo
-    resultado = pd.concat(dataframes, ignore_index=True)
-    
-    #retornar el DataFrame consolidado
-    return resultado
+    print(f"[OK] CENTROCOSTOSESTUDIANTE cargado con {centro_costos_estudiante.shape[0]} filas únicas.")
+    return centro_costos_estudiante
 
 #Cargar el archivo de centro de costos estudiante desde Excel, con columnas 'PERIODO', 'LISTA_CRUZADA', 'ESTADO_INSCRIPCIÓN' y 'COD_PROGRAMA_ESTUDIANTE'.
 #  Se filtra solo ESTADO_INSCRIPCIÓN='Inscrito' y se eliminan duplicados por: PERIODO, LISTA_CRUZADA, ESTADO_INSCRIPCIÓN, COD_PROGRAMA_ESTUDIANTE.
@@ -273,60 +274,16 @@ def leer_centrocostos_estudiante():
     Se filtra solo ESTADO_INSCRIPCIÓN='Inscrito' y se eliminan duplicados por:
     PERIODO, LISTA_CRUZADA, ESTADO_INSCRIPCIÓN, COD_PROGRAMA_ESTUDIANTE.
     """
-    directory = _resolve_path(CONFIG.get('banner_directory', './'), './')
-
-    if not os.path.isdir(directory):
-        raise FileNotFoundError(f"[ERROR] No se encontró el directorio de archivos .xlsx: {directory}")
-
-    excel_files = [f for f in os.listdir(directory) if f.endswith(".xlsx") and not f.startswith("~$")]
-    if not excel_files:
-        raise FileNotFoundError("[ERROR] No se encontró ningún archivo .xlsx en el directorio actual.")
-
-    columnas_objetivo = ['PERIODO', 'LISTA_CRUZADA', 'ESTADO_INSCRIPCIÓN', 'COD_PROGRAMA_ESTUDIANTE']
-    dataframes = []
-
-    for file in excel_files:
-        filepath = os.path.join(directory, file)
-        print(f"[INFO] Leyendo hoja Estudiantes (CentroCostos): {filepath}")
-
-        try:
-            # Se lee por nombre de hoja para cumplir la regla de negocio.
-            df = pd.read_excel(filepath, sheet_name='Estudiantes', engine='openpyxl')
-        except Exception as e:
-            print(f"[ERROR] Error al leer hoja Estudiantes de {file}: {e}")
-            continue
-
-        if not set(columnas_objetivo).issubset(set(df.columns)):
-            faltantes = set(columnas_objetivo) - set(df.columns)
-            print(f"[WARN] Advertencia: El archivo {file} no tiene columnas requeridas para centro de costos: {faltantes}")
-            continue
-
-        df = df[columnas_objetivo].copy()
-        df['PERIODO'] = df['PERIODO'].apply(_to_clean_str)
-        df['LISTA_CRUZADA'] = df['LISTA_CRUZADA'].apply(_to_clean_str)
-        df['ESTADO_INSCRIPCIÓN'] = df['ESTADO_INSCRIPCIÓN'].apply(_to_clean_str)
-        df['COD_PROGRAMA_ESTUDIANTE'] = df['COD_PROGRAMA_ESTUDIANTE'].apply(_to_clean_str)
-
-        # Solo se conservan estudiantes inscritos.
-        df = df[df['ESTADO_INSCRIPCIÓN'].str.lower() == 'inscrito']
-        df = df[
-            (df['PERIODO'] != '') &
-            (df['LISTA_CRUZADA'] != '') &
-            (df['COD_PROGRAMA_ESTUDIANTE'] != '')
-        ]
-
-        dataframes.append(df)
-
-    if not dataframes:
-        raise ValueError("[ERROR] No fue posible construir CENTROCOSTOSESTUDIANTE desde los archivos de banner.")
-
-    centro_costos_estudiante = pd.concat(dataframes, ignore_index=True)
-    centro_costos_estudiante = centro_costos_estudiante.drop_duplicates(
-        subset=['PERIODO', 'LISTA_CRUZADA', 'ESTADO_INSCRIPCIÓN', 'COD_PROGRAMA_ESTUDIANTE']
-    ).reset_index(drop=True)
+    return _consolidar_centrocostos(ingerir_banner(['centrocostos'])['centrocostos'])
 
-    print(f"[OK] CENTROCOSTOSESTUDIANTE cargado con {centro_costos_estudiante.shape[0]} filas únicas.")
-    return centro_costos_estudiante
+#Leer en una sola pasada por libro la hoja de docentes y CENTROCOSTOSESTUDIANTE (hoja Estudiantes)
+def leer_banner_docentes(date='nodate'):
+    """
+    Abre cada libro de Banner una sola vez y devuelve la tupla (moderadores, centro_costos_estudiante).
+    El filtro de fecha aplica solo a los docentes ('FECHA_ACTIVIDAD_DOC'), igual que leer_moderadores.
+    """
+    hojas = ingerir_banner(['docentes', 'centrocostos'], date)
+    return hojas['docentes'], _consolidar_centrocostos(hojas['centrocostos'])
 
 # Leer el archivo de coordinadores desde Excel, con columnas 'Centro de Costos' e 'ID COORDINADOR'.
 def leer_coordinadores(ruta_archivo=None):
@@ -380,69 +337,189 @@ def leer_coordinadores(ruta_archivo=None):
         print(f"[ERROR] Error al cargar coordinadores: {e}")
         return None
 
-#Buscar el coordinador del curso a partir del NRC/LC y Periodo, usando el DataFrame CENTROCOSTOSESTUDIANTE 
-# para obtener el COD_PROGRAMA_ESTUDIANTE y luego buscar el ID del coordinador en el archivo de coordinadores. 
-# Se devuelve un dict con la información del coordinador o None si no se encuentra.
-def resolver_coordinador_curso(course_nrc, course_periodo, centro_costos_estudiante, bd_coordinadores, log):
+#Se obtiene la información del coordinador desde el directorio de BDUsuarios (hoja 0) para el ID de banner dado. 
+# Si no se encuentra, se devuelve None.
+def obtener_datos_coordinador(id_banner, directorio_usuarios):
     """
-    Obtiene el ID del coordinador para un curso a partir de:
-      1) NRC + PERIODO -> COD_PROGRAMA_ESTUDIANTE (CENTROCOSTOSESTUDIANTE)
-      2) COD_PROGRAMA_ESTUDIANTE -> ID COORDINADOR (archivo coordinadores)
+    Obtiene información del coordinador desde el UserDirectory de BDUsuarios (hoja 0).
+    """
+    row = directorio_usuarios.obtener(id_banner)
+    if row is None:
+        return None
+
+    return {
+        'docuusu': _to_clean_str(row.get('OrgDefinedId', '')) or id_banner,
+        'first_name': _to_clean_str(row.get('FirstName', '')),
+        'last_name': _to_clean_str(row.get('LastName', '')),
+        'email': _to_clean_str(row.get('ExternalEmail', ''))
+    }
+
+#Construir una sola vez la tabla de coordinadores por curso, uniendo CENTROCOSTOSESTUDIANTE -> Centro de Costos
+# -> ID COORDINADOR -> BDUsuarios. Se devuelve un dict con clave (LISTA_CRUZADA, PERIODO) o None si faltan las fuentes.
+def construir_tabla_coordinadores(centro_costos_estudiante, bd_coordinadores, directorio_usuarios):
+    """
+    Precalcula la resolución de coordinador de todos los cursos:
+      1) NRC + PERIODO -> COD_PROGRAMA_ESTUDIANTE (CENTROCOSTOSESTUDIANTE), en orden de aparición.
+         Si hay varios centros se usa el primero (se conserva la lista para la advertencia).
+      2) COD_PROGRAMA_ESTUDIANTE -> ID COORDINADOR (primer registro del archivo coordinadores).
+      3) ID COORDINADOR -> datos de contacto en BDUsuarios, con fallback al archivo de coordinadores.
+
+    Cada valor del dict tiene las llaves:
+        'centros', 'centro_costo', 'estado' ('ok', 'sin_coordinador' o 'id_invalido') y
+        'coordinador' (dict con 'id', 'nuevo' y 'datos', o None).
     """
     if centro_costos_estudiante is None or bd_coordinadores is None:
+        return None
+
+    # Centro de Costos -> coordinador, resuelto una vez por centro
+    coordinadores = {}
+    primeros = bd_coordinadores.drop_duplicates(subset=['Centro de Costos'], keep='first')
+    for row_coord in primeros.to_dict('records'):
+        id_coord = _normalizar_id_banner(row_coord.get('ID COORDINADOR', ''))
+        if id_coord.lower() in INVALID_IDS:
+            coordinadores[row_coord['Centro de Costos']] = ('id_invalido', None)
+            continue
+
+        datos_coord = obtener_datos_coordinador(id_coord, directorio_usuarios)
+        if datos_coord is None:
+            # Fallback mínimo cuando el coordinador no está en BDUsuarios.
+            datos_coord = {
+                'docuusu': id_coord,
+                'first_name': _to_clean_str(row_coord.get('Coordinador(a)', '')),
+                'last_name': '',
+                'email': _to_clean_str(row_coord.get('Correo Electrónico', ''))
+            }
+
+        coordinadores[row_coord['Centro de Costos']] = ('ok', {
+            'id': id_coord,
+            'nuevo': id_coord not in directorio_usuarios,
+            'datos': datos_coord
+        })
+
+    # (LISTA_CRUZADA, PERIODO) -> centros de costos en orden de aparición, en un solo groupby
+    centros_por_curso = centro_costos_estudiante.groupby(
+        ['LISTA_CRUZADA', 'PERIODO'], sort=False
+    )['COD_PROGRAMA_ESTUDIANTE'].unique()
+
+    tabla = {}
+    for clave, centros in centros_por_curso.items():
+        centros = [str(centro).strip() for centro in centros]
+        estado, coordinador = coordinadores.get(centros[0], ('sin_coordinador', None))
+        tabla[clave] = {
+            'centros': centros,
+            'centro_costo': centros[0],
+            'estado': estado,
+            'coordinador': coordinador
+        }
+
+    print(f"[OK] Tabla de coordinadores construida para {len(tabla)} cursos (NRC/LC + Periodo).")
+    return tabla
+
+#Buscar el coordinador del curso a partir del NRC/LC y Periodo en la tabla precalculada de coordinadores.
+# Se devuelve un dict con la información del coordinador o None si no se encuentra.
+def resolver_coordinador_curso(course_nrc, course_periodo, tabla_coordinadores, log):
+    """
+    Obtiene el coordinador de un curso con una búsqueda en la tabla de construir_tabla_coordinadores.
+    Las advertencias se registran en el log del curso igual que en la resolución por filtros.
+    """
+    if tabla_coordinadores is None:
         return None, None
 
     nrc = _to_clean_str(course_nrc)
     periodo = _to_clean_str(course_periodo)
 
-    match_cc = centro_costos_estudiante[
-        (centro_costos_estudiante['LISTA_CRUZADA'].astype(str) == nrc) &
-        (centro_costos_estudiante['PERIODO'].astype(str) == periodo)
-    ]
-
-    if match_cc.empty:
+    registro = tabla_coordinadores.get((nrc, periodo))
+    if registro is None:
         log.write(f"[WARN] Sin COD_PROGRAMA_ESTUDIANTE para NRC={nrc}, PERIODO={periodo}\n")
         return None, None
 
-    centros = match_cc['COD_PROGRAMA_ESTUDIANTE'].dropna().astype(str).str.strip().unique().tolist()
-    centro_costo = centros[0]
+    centros = registro['centros']
+    centro_costo = registro['centro_costo']
     if len(centros) > 1:
         log.write(f"[WARN] NRC={nrc} PERIODO={periodo} tiene múltiples centros {centros}. Se usa: {centro_costo}\n")
 
-    match_coord = bd_coordinadores[bd_coordinadores['Centro de Costos'] == centro_costo]
-    if match_coord.empty:
+    if registro['estado'] == 'sin_coordinador':
         log.write(f"[WARN] Sin coordinador para Centro de Costos={centro_costo}\n")
         return None, centro_costo
 
-    row_coord = match_coord.iloc[0]
-    id_coordinador = _normalizar_id_banner(row_coord.get('ID COORDINADOR', ''))
-    if id_coordinador.lower() in INVALID_IDS:
+    if registro['estado'] == 'id_invalido':
         log.write(f"[WARN] ID COORDINADOR inválido para Centro de Costos={centro_costo}\n")
         return None, centro_costo
 
-    return row_coord, centro_costo
+    return registro['coordinador'], centro_costo
 
-#Se obtiene la información del coordinador desde BDUsuarios (hoja 0) para el ID de banner dado. 
-# Si no se encuentra, se devuelve None.
-def obtener_datos_coordinador(id_banner, bd_usuarios):
+#Genera por columnas los comandos de los docentes moderadores de un curso (o de toda la ejecución)
+def generar_comandos_moderadores(data, course_name, directorio_usuarios, log, registro=None):
     """
-    Obtiene información del coordinador desde BDUsuarios (hoja 0).
-    """
-    user = bd_usuarios.loc[bd_usuarios['UserName'] == id_banner]
-    if user.empty:
-        return None
+    Motor vectorizado del flujo de moderadores: cruza el listado con BDUsuarios (OrgRoleId)
+    y con MAPEO_ROLES_ARQUETIPO para obtener la unidad de la que se desmatricula cada docente,
+    y arma todas las lineas CREATE/UPDATE/UNENROLL/ENROLL sin recorrer fila a fila.
 
-    row = user.iloc[0]
-    return {
-        'docuusu': _to_clean_str(row.get('OrgDefinedId', '')) or id_banner,
-        'first_name': _to_clean_str(row.get('FirstName', '')),
-        'last_name': _to_clean_str(row.get('LastName', '')),
-        'email': _to_clean_str(row.get('ExternalEmail', ''))
-    }
+    Si se recibe un RegistroUsuarios, las lineas CREATE/UPDATE, UNENROLL de arquetipo y ENROLL
+    en UPBV se registran ahí (una sola vez por ejecución) y solo se devuelven las del curso.
+
+    Retorna:
+        (lineas, line_count): lista de lineas en el orden del listado y numero de moderadores inscritos.
+    """
+    rol_moderador = "Moderador"
+    if data.empty:
+        return [], 0
+
+    ids = _normalizar_ids_banner(data['ID_DOCENTE'])
+    invalidos = ids.isin(INVALID_IDS).to_numpy()
+    for idBanner in ids[invalidos]:
+        log.write(f"[ERROR] ID inválido: '{idBanner}' para curso {course_name}\n")
+
+    datos = data[~invalidos]
+    ids = ids[~invalidos]
+    if datos.empty:
+        return [], 0
+
+    # Join con BDUsuarios (OrgRoleId) y con el mapeo de roles de arquetipo
+    cruce = (
+        pd.DataFrame({'UserName': ids.to_numpy()})
+        .merge(directorio_usuarios.tabla[['OrgRoleId']], left_on='UserName', right_index=True, how='left')
+        .merge(MAPEO_ROLES_ARQUETIPO, on='OrgRoleId', how='left')
+    )
+    nuevo = ~directorio_usuarios.existen(ids).to_numpy()
+    # Usuario existente que ya es Moderador en BS (OrgRoleId, ver roles_org_ids): no hay cambio de arquetipo
+    rol_vigente = ~nuevo & directorio_usuarios.tienen_rol(ids, rol_moderador)
+    desmatricular = ~nuevo & ~rol_vigente & cruce['OrgUnidArquetipo'].notna().to_numpy()
+
+    ndocu = formatear_documentos(datos['DOCUMENTO'])
+    docuusu = datos['TIPO_DOCUMENTO'].map(str) + ". " + ndocu
+    first_name = datos['NOMBRE_DOCENTE'].map(str).str.strip()
+    last_name = datos['APELLIDO_DOCENTE'].map(str).str.strip()
+    email = datos['CORREO_DOCENTE'].map(str).str.strip()
+    datos_usuario = docuusu + ',' + first_name + ',' + last_name + ',,'
+
+    # Usuario existente, activo y con los mismos datos en BS: el UPDATE no cambia nada y se omite
+    sin_cambios = np.zeros(len(datos), dtype=bool)
+    if CONFIG.get('omitir_update_sin_cambios', True):
+        sin_cambios = ~nuevo & directorio_usuarios.sin_cambios(ids, docuusu, first_name, last_name, email)
+
+    linea_usuario = np.where(nuevo,
+                             'CREATE,' + ids + ',' + datos_usuario + rol_moderador + ',1,' + email,
+                             np.where(sin_cambios, '', 'UPDATE,' + ids + ',' + datos_usuario + '1,' + email))
+    linea_desmatricula = np.where(desmatricular,
+                                  'UNENROLL,' + ids.to_numpy() + ',,' + cruce['OrgUnidArquetipo'].fillna('').to_numpy(),
+                                  '')
+    linea_arquetipo = np.where(nuevo | rol_vigente, '', 'ENROLL,' + ids + ',,' + rol_moderador + ',UPBV')
+    linea_curso = ('ENROLL,' + ids + ',,' + rol_moderador + ',' + course_name).to_numpy()
+
+    if registro is not None:
+        lineas_usuario = np.column_stack([linea_usuario, linea_desmatricula, linea_arquetipo]).ravel()
+        registro.registrar(lineas_usuario[lineas_usuario != ''].tolist())
+        return linea_curso.tolist(), len(datos)
+
+    # Se intercalan las lineas de cada docente conservando el orden del listado y se descartan las vacias
+    lineas = np.column_stack([linea_usuario, linea_desmatricula, linea_arquetipo, linea_curso]).ravel()
+    return lineas[lineas != ''].tolist(), len(datos)
 
 #se crea el archivo de registro para cada curso
-def crearArchivos(data, course_name, course_nrc, course_periodo, BDUsuBS, centro_costos_estudiante,
-                  bd_coordinadores, log_file_path='log_creacion_moderadores.txt'):
+def crearArchivos(data, course_name, course_nrc, course_periodo, directorio_usuarios, tabla_coordinadores,
+                  registro=None, salida=None, delta=None, reconciliacion=None,
+                  log_file_path='log_creacion_moderadores.txt'):
     """
     Genera comandos de inscripción y creación/actualización para:
       1) Docente con rol Moderador (flujo original).
@@ -453,100 +530,72 @@ def crearArchivos(data, course_name, course_nrc, course_periodo, BDUsuBS, centro
         course_name (str): Nombre del curso.
         course_nrc (str): NRC del curso.
         course_periodo (str): Periodo del curso.
-        BDUsuBS (pd.DataFrame): Base de usuarios de Brightspace.
-        centro_costos_estudiante (pd.DataFrame): CENTROCOSTOSESTUDIANTE.
-        bd_coordinadores (pd.DataFrame): Archivo de coordinadores.
+        directorio_usuarios (UserDirectory): Base de usuarios de Brightspace indexada por UserName.
+        tabla_coordinadores (dict): Coordinador por (LISTA_CRUZADA, PERIODO), ver construir_tabla_coordinadores.
+        registro (RegistroUsuarios, opcional): Comandos a nivel de usuario ya emitidos en la ejecución;
+            si se indica, los CREATE/UPDATE/arquetipo (incluido el CREATE del coordinador) se emiten una sola vez.
+        salida (SalidaUnica, opcional): Recibe las lineas del curso en lugar del archivo registro_<curso>.txt.
+        delta (DeltaEjecucion, opcional): Deja solo los cambios respecto al snapshot de la ejecución anterior.
+        reconciliacion (ReconciliacionBS, opcional): Concilia contra el export de inscripciones de Brightspace.
         log_file_path (str): Ruta al archivo de log.
     """
-    rol_moderador = "Moderador"
     rol_coordinador = "Coordinador"
-    line_count = 0
 
-    directory = _resolve_path(CONFIG.get('salida_directory', './salida/'), './salida/')
-    os.makedirs(directory, exist_ok=True)
-    archivo_comandos = os.path.join(directory, f"registro_{course_name}.txt")
-    usuarios_bs = set(BDUsuBS['UserName'].astype(str).tolist())
-
-    with open(archivo_comandos, 'a', encoding='utf8') as fptr, \
-         open(log_file_path, 'a', encoding='utf8') as log, \
+    with open(log_file_path, 'a', encoding='utf8') as log, \
          open('moderadores.csv', 'a', encoding='utf8', newline='') as moderadores:
 
         writer = csv.writer(moderadores)
         log.write(f"\n=== PROCESAMIENTO CURSO: {course_name} - NRC: {course_nrc} ===\n")
         log.write(f"Fecha: {datetime.now()}\n")
 
-        # 1) Inscripción de docentes moderadores (flujo existente).
-        for _, row in data.iterrows():
-            idBanner = _normalizar_id_banner(row.get('ID_DOCENTE', ''))
-            if idBanner.lower() in INVALID_IDS:
-                log.write(f"[ERROR] ID inválido: '{idBanner}' para curso {course_name}\n")
-                continue
-
-            Unuevo = idBanner not in usuarios_bs
-            RolModerador = BDUsuBS.loc[BDUsuBS['UserName'] == idBanner, 'OrgRoleId'].values
-
-            try:
-                ndocu = "{:,}".format(int(row['DOCUMENTO'])).replace(',', '.')
-            except Exception:
-                ndocu = str(row['DOCUMENTO'])
-
-            try:
-                docuusu = f"{row['TIPO_DOCUMENTO']}. {ndocu}"
-            except Exception:
-                docuusu = ndocu
-
-            first_name = str(row.get('NOMBRE_DOCENTE', '')).strip()
-            last_name = str(row.get('APELLIDO_DOCENTE', '')).strip()
-            email = str(row.get('CORREO_DOCENTE', '')).strip()
-
-            if Unuevo:
-                fptr.write(f'CREATE,{idBanner},{docuusu},{first_name},{last_name},,{rol_moderador},1,{email}\n')
-            else:
-                fptr.write(f'UPDATE,{idBanner},{docuusu},{first_name},{last_name},,1,{email}\n')
-                if RolModerador.size > 0:
-                    rol = str(RolModerador[0])
-                    mapeo_roles = {
-                        '150': 'CVTE', '143': 'CVLA', '138': 'CVPR',
-                        '137': 'CVFC', '136': 'CVFA', '135': 'CVFA'
-                    }
-                    if rol in mapeo_roles:
-                        fptr.write(f'UNENROLL,{idBanner},,{mapeo_roles[rol]}\n')
-
-                fptr.write(f'ENROLL,{idBanner},,{rol_moderador},UPBV\n')
-
-            fptr.write(f'ENROLL,{idBanner},,{rol_moderador},{course_name}\n')
-            line_count += 1
-
-        # 2) Inscripción de coordinador por curso (nuevo flujo).
-        row_coord, centro_costo = resolver_coordinador_curso(
-            course_nrc, course_periodo, centro_costos_estudiante, bd_coordinadores, log
-        )
-        if row_coord is not None:
-            id_coord = _normalizar_id_banner(row_coord.get('ID COORDINADOR', ''))
-            if id_coord.lower() not in INVALID_IDS:
-                coord_nuevo = id_coord not in usuarios_bs
-                datos_coord = obtener_datos_coordinador(id_coord, BDUsuBS)
-
-                if datos_coord is None:
-                    # Fallback mínimo cuando el coordinador no está en BDUsuarios.
-                    datos_coord = {
-                        'docuusu': id_coord,
-                        'first_name': _to_clean_str(row_coord.get('Coordinador(a)', '')),
-                        'last_name': '',
-                        'email': _to_clean_str(row_coord.get('Correo Electrónico', ''))
-                    }
-
-                if coord_nuevo:
-                    fptr.write(
-                        f"CREATE,{id_coord},{datos_coord['docuusu']},{datos_coord['first_name']},"
-                        f"{datos_coord['last_name']},,{rol_coordinador},1,{datos_coord['email']}\n"
-                    )
-
-                fptr.write(f'ENROLL,{id_coord},,{rol_coordinador},{course_name}\n')
-                log.write(
-                    f"[OK] Coordinador inscrito NRC={course_nrc}, PERIODO={course_periodo}, "
-                    f"CentroCosto={centro_costo}, ID={id_coord}\n"
+        # 1) Inscripción de docentes moderadores (flujo existente), generada por columnas en una sola escritura.
+        lineas, line_count = generar_comandos_moderadores(data, course_name, directorio_usuarios, log, registro)
+
+        # 2) Inscripción de coordinador por curso (nuevo flujo), búsqueda en la tabla precalculada.
+        coordinador, centro_costo = resolver_coordinador_curso(course_nrc, course_periodo, tabla_coordinadores, log)
+        if coordinador is not None:
+            id_coord = coordinador['id']
+            datos_coord = coordinador['datos']
+
+            if coordinador['nuevo']:
+                linea_create = (
+                    f"CREATE,{id_coord},{datos_coord['docuusu']},{datos_coord['first_name']},"
+                    f"{datos_coord['last_name']},,{rol_coordinador},1,{datos_coord['email']}"
                 )
+                if registro is not None:
+                    registro.registrar([linea_create])
+                else:
+                    lineas.append(linea_create)
+
+            lineas.append(f'ENROLL,{id_coord},,{rol_coordinador},{course_name}')
+            log.write(
+                f"[OK] Coordinador inscrito NRC={course_nrc}, PERIODO={course_periodo}, "
+                f"CentroCosto={centro_costo}, ID={id_coord}\n"
+            )
+
+        # Modo delta: solo inscripciones nuevas (y bajas del curso si están habilitadas). Se calcula antes de
+        # conciliar: el snapshot y las bajas deben ver también los ENROLL que ya están vigentes en Brightspace
+        if delta is not None:
+            lineas = delta.filtrar_curso(course_name, lineas)
+
+        # Conciliación con Brightspace: sin ENROLL ya vigentes, UNENROLL de moderadores que no están en Banner
+        if reconciliacion is not None:
+            lineas = reconciliacion.filtrar(lineas)
+            huerfanos = reconciliacion.huerfanos(course_name, _normalizar_ids_banner(data['ID_DOCENTE']), "Moderador")
+            if delta is not None:
+                huerfanos = delta.filtrar(huerfanos)
+            emitidas = set(lineas)
+            lineas += [linea for linea in huerfanos if linea not in emitidas]
+
+        # 3) Lineas del curso en una sola escritura: registro_<curso>.txt o sección del consolidado (salida única)
+        if salida is not None:
+            salida.escribir_curso(course_name, lineas)
+        else:
+            directory = _resolve_path(CONFIG.get('salida_directory', './salida/'), './salida/')
+            os.makedirs(directory, exist_ok=True)
+            archivo_comandos = os.path.join(directory, f"registro_{course_name}.txt")
+            with open(archivo_comandos, 'a', encoding='utf8') as fptr:
+                fptr.write(''.join(linea + '\n' for linea in lineas))
 
         writer.writerow([course_name, course_nrc, line_count])
 
@@ -11,6 +11,7 @@ def main():
         print('Número de entradas inválido. Saliendo...')
         return
 
+    date_time_obj = None
     if(len(sys.argv) == 2):
         date_time_str = sys.argv[1] + ' 00:00:00'
         date_time_obj = datetime.strptime(date_time_str, '%d/%m/%y %H:%M:%S')
@@ -35,6 +36,9 @@ def main():
     BDestudiantes = helpers.leer_BDUsuarios_BS()
     print(BDestudiantes)
     print ("\n")
+
+    # Directorio de usuarios BS indexado por UserName, se construye una sola vez
+    DirectorioUsuarios = helpers.UserDirectory(BDestudiantes)
  
     # Leer datos de los NRC/LC que se incribiran - shortname.csv (se arma desde el bot getshortname)
     nrc = helpers.leer_nrc()
@@ -51,27 +55,55 @@ def main():
     # Remover duplicados x Pediodo, NRC/LC y ID_Estudiante
     data_sin_duplicados = BDEstudiantesNRC.drop_duplicates(subset=['PERIODO', 'NRC', 'ID_ESTUDIANTE'])
 
+    # Operaciones de la ejecución: la de Tipo_proceso, o Matricular + Desmatricular + Limpieza si es "Todos"
+    Operaciones = helpers.operaciones_proceso()
+
+    # Registro de la ejecución por operación: cada CREATE/UPDATE/ENROLL de arquetipo se emite una sola vez
+    RegistrosUsuarios = {operacion: helpers.RegistroUsuarios() for operacion in Operaciones}
+
+    # Salida única (salida_modo = "unico"): un solo consolidado + índice, sin archivos por curso ni merge
+    Salidas = {operacion: helpers.crear_salida(operacion) for operacion in Operaciones}
+
+    # Modo delta (modo_delta): solo cambios respecto al snapshot de la ejecución anterior
+    Delta = helpers.crear_delta(date_time_obj)
+
+    # Conciliación con el export de inscripciones de Brightspace (inscripciones_bs_file), opcional
+    Reconciliacion = helpers.crear_reconciliacion(nrc, date_time_obj)
+
     # Crear los archivos: CSV para inscripcion, uno por NRC y se genera resumen de inscripcion (student.csv)
-    for index, row in nrc.iterrows():
-        course_name = row['Nombre']     #Codigo del curso
-        course_nrc = row['NRC']         #NRC/LC del curso
-        course_periodo = row['Periodo'] #Periodo del curso
-
-        # cuando la longitud del course_periodo es mayor a 6, se toma solo los primeros 6 caracteres -- Regla de negocio APLATAM (se elimina V1,V2, etc)
-        if len(str(course_periodo)) > 6:    
-            course_periodo = str(course_periodo)[:6]
-
-        #Se filtra el dataframe "EstudiantesInscribir"por el Periodo y NRC/LC del curso
-        EstudiantesInscribir = data_sin_duplicados[
-                (data_sin_duplicados['PERIODO'].astype(str) == str(course_periodo)) &
-                (data_sin_duplicados['LISTA_CRUZADA'].astype(str) == str(course_nrc))
-        ] 
-                
-        # Crear los archivos para inscripcion
-        helpers.crearArchivos(EstudiantesInscribir, course_name, course_nrc, course_periodo, BDestudiantes)
-
-    #se crea un solo archvivo con todos los cursos: registro_unicoEst.txt
-    helpers.merge_archivos()
+    # Los estudiantes se particionan una sola vez por Periodo y NRC/LC (incluye la regla APLATAM del periodo)
+    # y cada partición alimenta todas las operaciones de la ejecución
+    for course_name, course_nrc, course_periodo, EstudiantesInscribir in helpers.particionar_cursos(nrc, data_sin_duplicados):
+        for operacion in Operaciones:
+            # Crear los archivos para inscripcion
+            helpers.crearArchivos(EstudiantesInscribir, course_name, course_nrc, course_periodo, DirectorioUsuarios,
+                                  RegistrosUsuarios[operacion], Salidas[operacion], Delta, Reconciliacion, operacion)
+
+    for operacion in Operaciones:
+        RegistroUsuarios = RegistrosUsuarios[operacion]
+
+        # Delta antes de conciliar: el snapshot registra también los cambios de rol ya vigentes en Brightspace
+        if Delta is not None:
+            RegistroUsuarios.lineas = Delta.filtrar(RegistroUsuarios.lineas)
+
+        if Reconciliacion is not None:
+            RegistroUsuarios.lineas = Reconciliacion.filtrar(RegistroUsuarios.lineas)
+
+        if Salidas[operacion] is not None:
+            # Comandos a nivel de usuario + cursos directo al consolidado (con índice por curso)
+            Salidas[operacion].cerrar(RegistroUsuarios)
+        else:
+            # Comandos a nivel de usuario de toda la ejecución (se ubican antes de los cursos en el merge)
+            helpers.guardar_registro_usuarios(RegistroUsuarios, operacion)
+
+            #se crea un solo archvivo con todos los cursos: registro_unicoEst.txt (o el de cada operación)
+            helpers.merge_archivos(operacion)
+
+    if Reconciliacion is not None:
+        Reconciliacion.resumen()
+
+    if Delta is not None:
+        Delta.guardar()
 
     print("\n-------------------------------")
     print("Limpieza de memoria.............")
@@ -80,7 +112,7 @@ def main():
     #Limpiar los DataFrames para liberar memoria
     BDEstudiantesNRC.drop(BDEstudiantesNRC.index, inplace=True)             # Limpiar el DataFrame QLIK para liberar memoria
     BDestudiantes.drop(BDestudiantes.index, inplace=True)                   # Limpiar el DataFrame de estudiantes BS
-    del BDEstudiantesNRC, BDestudiantes                                     # Eliminar las variables para liberar memoria
+    del BDEstudiantesNRC, BDestudiantes, DirectorioUsuarios, RegistrosUsuarios # Eliminar las variables para liberar memoria
     gc.collect()                                                            # Liberar memoria
 
     print("\n-------------------------------")
@@ -11,6 +11,7 @@ def main():
         print('Número de entradas inválido. Saliendo...')
         return
 
+    date_time_obj = None
     if(len(sys.argv) == 2):
         date_time_str = sys.argv[1] + ' 00:00:00'
         date_time_obj = datetime.strptime(date_time_str, '%d/%m/%y %H:%M:%S')
@@ -19,9 +20,9 @@ def main():
             print('La fecha de entrada no puede ser mayor a la fecha actual.')
             return
         
-        BDModeradoresNRC = helpers.leer_moderadores(date_time_obj)
+        BDModeradoresNRC, CENTROCOSTOSESTUDIANTE = helpers.leer_banner_docentes(date_time_obj)
     else:
-        BDModeradoresNRC = helpers.leer_moderadores()
+        BDModeradoresNRC, CENTROCOSTOSESTUDIANTE = helpers.leer_banner_docentes()
 
     print("\n---------------------------------")
     print("BD Moderadores y NRC a inscribir")
@@ -35,9 +36,16 @@ def main():
     BDUsuarios = helpers.leer_BDUsuarios_BS()
     print(BDUsuarios)
     print ("\n")
+
+    # Directorio de usuarios BS indexado por UserName, se construye una sola vez
+    DirectorioUsuarios = helpers.UserDirectory(BDUsuarios)
  
     # Leer datos de los NRC/LC que se incribiran - shortname.csv
     CURSOS = helpers.leer_nrc( )
+
+    if CURSOS is None:
+        # Si no se pudo leer el archivo de NRC/LC, se sale del programa
+        return
      
     print("\n-------------------------------")
     print("Cursos a inscribir")
@@ -45,11 +53,13 @@ def main():
     print(CURSOS)
 
     print("\n----------------------------------------------")
-    print("Cargando CentroCostosEstudiante y Coordinadores")
+    print("Cargando Coordinadores (CentroCostosEstudiante se leyó con los docentes)")
     print("----------------------------------------------")
-    CENTROCOSTOSESTUDIANTE = helpers.leer_centrocostos_estudiante()
     BDCoordinadores = helpers.leer_coordinadores()
 
+    # Resolución de coordinadores precalculada: (NRC/LC, Periodo) -> coordinador
+    TablaCoordinadores = helpers.construir_tabla_coordinadores(CENTROCOSTOSESTUDIANTE, BDCoordinadores, DirectorioUsuarios)
+
     # Remover duplicados x Pediodo, NRC/LC y ID_Docente
     data_sin_duplicados = BDModeradoresNRC.drop_duplicates(subset=['PERIODO', 'NRC', 'ID_DOCENTE'])
 
@@ -57,31 +67,54 @@ def main():
     print("Iniciando proceso de inscripcion")
     print("----------------------------------")
 
-    # Crear los archivos: CSV para inscripcion, uno por NRC y se genera resumen de inscripcion (moderadores.csv)
-    for index,row in CURSOS.iterrows():
-        course_name = row['Nombre']     #Codigo del curso
-        course_nrc = row['NRC']         #NRC/LC del curso
-        course_periodo = row['Periodo'] #Periodo del curso
-
-        #Se filtra el dataframe "ModeradoresInscribir" por el Periodo y NRC/LC del curso
-        ModeradoresInscribir = data_sin_duplicados[ 
-                #(data_sin_duplicados['PERIODO'].astype(str) == str(course_periodo)) & 
-                (data_sin_duplicados['PERIODO'] == course_periodo) &
-                (data_sin_duplicados['LISTA_CRUZADA'] == course_nrc)
-        ]
+    # Registro de la ejecución: cada CREATE/UPDATE/arquetipo (y el CREATE de coordinadores) se emite una sola vez
+    RegistroUsuarios = helpers.RegistroUsuarios()
+
+    # Salida única (salida_modo = "unico"): un solo consolidado + índice, sin archivos por curso ni merge
+    Salida = helpers.crear_salida()
+
+    # Modo delta (modo_delta): solo cambios respecto al snapshot de la ejecución anterior
+    Delta = helpers.crear_delta(date_time_obj)
 
+    # Conciliación con el export de inscripciones de Brightspace (inscripciones_bs_file), opcional
+    Reconciliacion = helpers.crear_reconciliacion(CURSOS, date_time_obj)
+
+    # Crear los archivos: CSV para inscripcion, uno por NRC y se genera resumen de inscripcion (moderadores.csv)
+    # Los docentes se particionan una sola vez por Periodo y NRC/LC (incluye la regla APLATAM del periodo)
+    for course_name, course_nrc, course_periodo, ModeradoresInscribir in helpers.particionar_cursos(CURSOS, data_sin_duplicados):
         helpers.crearArchivos(
             ModeradoresInscribir,
             course_name,
             course_nrc,
             course_periodo,
-            BDUsuarios,
-            CENTROCOSTOSESTUDIANTE,
-            BDCoordinadores
+            DirectorioUsuarios,
+            TablaCoordinadores,
+            RegistroUsuarios,
+            Salida,
+            Delta,
+            Reconciliacion
         )
 
-    #se crea un solo archvivo con todos los cursos
-    helpers.merge_archivos()
+    # Delta antes de conciliar: el snapshot registra también los cambios de rol ya vigentes en Brightspace
+    if Delta is not None:
+        RegistroUsuarios.lineas = Delta.filtrar(RegistroUsuarios.lineas)
+
+    if Reconciliacion is not None:
+        RegistroUsuarios.lineas = Reconciliacion.filtrar(RegistroUsuarios.lineas)
+        Reconciliacion.resumen()
+
+    if Salida is not None:
+        # Comandos a nivel de usuario + cursos directo al consolidado (con índice por curso)
+        Salida.cerrar(RegistroUsuarios)
+    else:
+        # Comandos a nivel de usuario de toda la ejecución (se ubican antes de los cursos en el merge)
+        helpers.guardar_registro_usuarios(RegistroUsuarios)
+
+        #se crea un solo archvivo con todos los cursos
+        helpers.merge_archivos()
+
+    if Delta is not None:
+        Delta.guardar()
 
     print("\n------------------------------------------")
     print("Finaliza proceso de inscripcion de moderadores")
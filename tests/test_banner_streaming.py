@@ -0,0 +1,45 @@
+from datetime import datetime
+
+import pandas as pd
+from openpyxl import Workbook, load_workbook
+
+from helperscomunV2 import _leer_hoja_streaming
+
+COLUMNAS = {'PERIODO', 'NRC', 'ID_ESTUDIANTE', 'FECHA_ACTIVIDAD_EST'}
+CORTE = pd.Timestamp('2026-03-01')
+
+
+def _libro(tmp_path):
+    wb = Workbook()
+    ws = wb.active
+    ws.title = 'Estudiantes'
+    ws.append(['PERIODO', 'NRC', 'ID_ESTUDIANTE', 'FECHA_ACTIVIDAD_EST', 'OTRA'])
+    ws.append([None, None, None, None, None])                                  # fila vacía
+    ws.append([202610, 100, '000001000', datetime(2026, 1, 15), 'x'])          # anterior al corte
+    ws.append([202610, 100, '000001001', datetime(2026, 3, 2), 'y'])
+    ws.append([202610, 101, '000001002', datetime(2026, 3, 5), 'z'])
+    ruta = tmp_path / 'banner.xlsx'
+    wb.save(ruta)
+    return load_workbook(ruta, read_only=True, data_only=True, keep_links=False)
+
+
+def test_corte_en_la_lectura_conserva_los_tipos(tmp_path):
+    libro = _libro(tmp_path)
+    dtype = {'ID_ESTUDIANTE': str}
+    completo = _leer_hoja_streaming(libro, 'Estudiantes', COLUMNAS, dtype)
+    con_corte = _leer_hoja_streaming(libro, 'Estudiantes', COLUMNAS, dtype, 'FECHA_ACTIVIDAD_EST', CORTE)
+    libro.close()
+
+    # Mismo resultado que leer la hoja completa (como la cache) y aplicar el corte después
+    esperado = completo[completo['FECHA_ACTIVIDAD_EST'] >= CORTE].reset_index(drop=True)
+    pd.testing.assert_frame_equal(con_corte, esperado)
+    assert con_corte['PERIODO'].dtype == float and con_corte['NRC'].tolist() == [100.0, 101.0]
+
+
+def test_lectura_completa_equivale_a_read_excel(tmp_path):
+    libro = _libro(tmp_path)
+    completo = _leer_hoja_streaming(libro, 'Estudiantes', COLUMNAS, {'ID_ESTUDIANTE': str})
+    libro.close()
+
+    esperado = pd.read_excel(tmp_path / 'banner.xlsx', dtype={'ID_ESTUDIANTE': str})[list(completo.columns)]
+    pd.testing.assert_series_equal(completo.dtypes, esperado.dtypes)
@@ -0,0 +1,22 @@
+from helperscomunV2 import DeltaEjecucion
+
+
+def test_enroll_reemplaza_el_rol_vigente(tmp_path):
+    delta = DeltaEjecucion(str(tmp_path / 'snapshot.pkl'))
+
+    assert delta.filtrar(['ENROLL,000000001,,Student_pr,UPBV']) == ['ENROLL,000000001,,Student_pr,UPBV']
+    assert delta.filtrar(['ENROLL,000000001,,Student_fa,UPBV']) == ['ENROLL,000000001,,Student_fa,UPBV']
+    # Volver al rol anterior es un cambio: Brightspace quedó con Student_fa
+    assert delta.filtrar(['ENROLL,000000001,,Student_pr,UPBV']) == ['ENROLL,000000001,,Student_pr,UPBV']
+    assert delta.filtrar(['ENROLL,000000001,,Student_pr,UPBV']) == []
+
+
+def test_snapshot_persiste_el_rol_vigente(tmp_path):
+    ruta = str(tmp_path / 'snapshot.pkl')
+    delta = DeltaEjecucion(ruta)
+    delta.filtrar(['ENROLL,000000001,,Student_pr,UPBV', 'ENROLL,000000001,,Student_fa,UPBV'])
+    delta.guardar()
+
+    siguiente = DeltaEjecucion(ruta)
+    assert siguiente.filtrar(['ENROLL,000000001,,Student_fa,UPBV']) == []
+    assert siguiente.filtrar(['ENROLL,000000001,,Student_pr,UPBV']) == ['ENROLL,000000001,,Student_pr,UPBV']
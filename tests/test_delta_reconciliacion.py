@@ -0,0 +1,129 @@
+import pandas as pd
+
+import helpersestV2
+import helpersmodV2
+from helperscomunV2 import DeltaEjecucion, ReconciliacionBS, RegistroUsuarios, UserDirectory
+
+CURSO = 'CUR-202641-1001'
+
+
+class SalidaMemoria:
+    """Sustituto de SalidaUnica: guarda las lineas de cada curso"""
+    def __init__(self):
+        self.cursos = {}
+
+    def escribir_curso(self, course_name, lineas):
+        self.cursos[course_name] = list(lineas)
+
+
+def _estudiantes():
+    return pd.DataFrame({
+        'ID_ESTUDIANTE': ['000001000', '000001001'],
+        'ESTADO_INSCRIPCIÓN': ['Inscrito', 'Inscrito'],
+        'SOCIO_INTEGRADOR': ['BS', 'BS'],
+        'PAGO': ['Y', 'Y'],
+        'TIPO_DOCUMENTO': ['CC', 'CC'],
+        'DOCUMENTO': [1000, 1001],
+        'NOMBRE_ESTUDIANTE': ['Ana', 'Luis'],
+        'APELLIDO_ESTUDIANTE': ['Ruiz', 'Gil'],
+        'CORREO_ESTUDIANTE': ['ana@upb.edu.co', 'luis@upb.edu.co'],
+    })
+
+
+def _docentes():
+    return pd.DataFrame({
+        'ID_DOCENTE': ['000002000', '000002001'],
+        'TIPO_DOCUMENTO': ['CC', 'CC'],
+        'DOCUMENTO': [2000, 2001],
+        'NOMBRE_DOCENTE': ['Eva', 'Juan'],
+        'APELLIDO_DOCENTE': ['Paz', 'Mora'],
+        'CORREO_DOCENTE': ['eva@upb.edu.co', 'juan@upb.edu.co'],
+    })
+
+
+def _inscripciones_bs(usuario, rol):
+    return pd.DataFrame({'UserName': [usuario], 'OrgUnitCode': [CURSO], 'RoleName': [rol]})
+
+
+def _ejecutar_estudiantes(ruta_snapshot, reconciliacion):
+    delta = DeltaEjecucion(ruta_snapshot, permitir_bajas=True)
+    salida = SalidaMemoria()
+    helpersestV2.crearArchivos(_estudiantes(), CURSO, '1001', '202641', UserDirectory(None),
+                               registro=RegistroUsuarios(), salida=salida, delta=delta, reconciliacion=reconciliacion)
+    delta.guardar()
+    return salida.cursos[CURSO]
+
+
+def _ejecutar_moderadores(ruta_snapshot, reconciliacion):
+    delta = DeltaEjecucion(ruta_snapshot, permitir_bajas=True)
+    salida = SalidaMemoria()
+    helpersmodV2.crearArchivos(_docentes(), CURSO, '1001', '202641', UserDirectory(None), None,
+                               registro=RegistroUsuarios(), salida=salida, delta=delta, reconciliacion=reconciliacion)
+    delta.guardar()
+    return salida.cursos[CURSO]
+
+
+def test_estudiante_ya_inscrito_en_bs_no_recibe_baja_delta(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setitem(helpersestV2.CONFIG, 'Tipo_proceso', 'Matricular')
+    ruta = str(tmp_path / 'snapshot_Est.pkl')
+    primera = _ejecutar_estudiantes(ruta, None)
+    assert primera == [f'ENROLL,000001000,,Student,{CURSO}', f'ENROLL,000001001,,Student,{CURSO}']
+
+    # El primer archivo se importó a medias: 000001000 ya está en Brightspace y sigue Inscrito en Banner
+    reconciliacion = ReconciliacionBS(_inscripciones_bs('000001000', 'Student'))
+    segunda = _ejecutar_estudiantes(ruta, reconciliacion)
+    assert segunda == []
+
+
+def test_moderador_ya_inscrito_en_bs_no_recibe_baja_delta(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    ruta = str(tmp_path / 'snapshot_MOD.pkl')
+    _ejecutar_moderadores(ruta, None)
+
+    reconciliacion = ReconciliacionBS(_inscripciones_bs('000002000', 'Moderador'))
+    segunda = _ejecutar_moderadores(ruta, reconciliacion)
+    assert not [linea for linea in segunda if linea.startswith('UNENROLL')]
+
+
+def test_baja_delta_y_huerfano_no_se_duplican(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    ruta = str(tmp_path / 'snapshot_MOD.pkl')
+    _ejecutar_moderadores(ruta, None)
+
+    # 000002001 sale del listado de Banner y sigue inscrito en Brightspace: baja delta y huérfano a la vez
+    delta = DeltaEjecucion(ruta, permitir_bajas=True)
+    salida = SalidaMemoria()
+    reconciliacion = ReconciliacionBS(pd.DataFrame({
+        'UserName': ['000002000', '000002001'], 'OrgUnitCode': [CURSO, CURSO], 'RoleName': ['Moderador', 'Moderador'],
+    }))
+    helpersmodV2.crearArchivos(_docentes().iloc[:1], CURSO, '1001', '202641', UserDirectory(None), None,
+                               registro=RegistroUsuarios(), salida=salida, delta=delta, reconciliacion=reconciliacion)
+    assert salida.cursos[CURSO] == [f'UNENROLL,000002001,,{CURSO}']
+
+
+def _ejecutar_todos(ruta_snapshot, estudiantes):
+    delta = DeltaEjecucion(ruta_snapshot, permitir_bajas=True)
+    salidas = {operacion: SalidaMemoria() for operacion in helpersestV2.OPERACIONES}
+    for operacion in helpersestV2.OPERACIONES:
+        helpersestV2.crearArchivos(estudiantes, CURSO, '1001', '202641', UserDirectory(None),
+                                   registro=RegistroUsuarios(), salida=salidas[operacion], delta=delta,
+                                   operacion=operacion)
+    delta.guardar()
+    return [linea for salida in salidas.values() for linea in salida.cursos.get(CURSO, [])]
+
+
+def test_todos_emite_una_sola_vez_la_baja_de_un_cancelado(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setitem(helpersestV2.CONFIG, 'Tipo_proceso', 'Todos')
+    ruta = str(tmp_path / 'snapshot_Est.pkl')
+    _ejecutar_todos(ruta, _estudiantes())
+
+    # 000001000 pasa de Inscrito a Cancelado: la baja la emite Desmatricular, no también el delta de Matricular
+    estudiantes = _estudiantes()
+    estudiantes.loc[0, 'ESTADO_INSCRIPCIÓN'] = 'Cancelado'
+    segunda = _ejecutar_todos(ruta, estudiantes)
+    assert segunda.count(f'UNENROLL,000001000,,{CURSO}') == 1
+
+    # La baja salió del snapshot: en la ejecución siguiente solo la emite Desmatricular
+    assert _ejecutar_todos(ruta, estudiantes).count(f'UNENROLL,000001000,,{CURSO}') == 1
@@ -0,0 +1,55 @@
+import pytest
+
+import helpersestV2
+import helpersmodV2
+from helperscomunV2 import RegistroUsuarios, UserDirectory
+from test_delta_reconciliacion import _docentes, _estudiantes
+
+# 'registro_C-...' queda antes de 'registro_usuarios_...' en orden alfabético
+CURSO = 'C-100-202641'
+
+
+def _ejecutar_estudiantes():
+    registro = RegistroUsuarios()
+    helpersestV2.crearArchivos(_estudiantes(), CURSO, '100', '202641', UserDirectory(None), registro=registro)
+    helpersestV2.guardar_registro_usuarios(registro)
+    helpersestV2.merge_archivos()
+
+
+def _ejecutar_moderadores():
+    registro = RegistroUsuarios()
+    helpersmodV2.crearArchivos(_docentes(), CURSO, '100', '202641', UserDirectory(None), None, registro=registro)
+    helpersmodV2.guardar_registro_usuarios(registro)
+    helpersmodV2.merge_archivos()
+
+
+def _create_antes_de_enroll(ruta):
+    creados = set()
+    with open(ruta, encoding='utf8') as fp:
+        for linea in fp:
+            campos = linea.rstrip('\n').split(',')
+            if campos[0] == 'CREATE':
+                creados.add(campos[1])
+            elif campos[0] == 'ENROLL':
+                assert campos[1] in creados, f'ENROLL antes del CREATE de {campos[1]}'
+    return creados
+
+
+@pytest.mark.parametrize('orden', [(_ejecutar_estudiantes, _ejecutar_moderadores),
+                                   (_ejecutar_moderadores, _ejecutar_estudiantes)])
+def test_merge_con_ambos_flujos_en_la_misma_salida(tmp_path, monkeypatch, orden):
+    monkeypatch.chdir(tmp_path)
+    salida = str(tmp_path / 'salida') + '/'
+    (tmp_path / 'salida').mkdir()
+    for config in (helpersestV2.CONFIG, helpersmodV2.CONFIG):
+        monkeypatch.setitem(config, 'salida_directory', salida)
+        monkeypatch.setitem(config, 'Tipo_proceso', 'Matricular')
+        monkeypatch.setitem(config, 'salida_modo', 'por_curso')
+        monkeypatch.setitem(config, 'merge_gzip', False)
+
+    for ejecutar in orden:
+        ejecutar()
+
+    creados = _create_antes_de_enroll(tmp_path / helpersestV2.ARCHIVO_UNICO)
+    creados |= _create_antes_de_enroll(tmp_path / helpersmodV2.ARCHIVO_UNICO)
+    assert {'000001000', '000001001', '000002000', '000002001'} <= creados
@@ -0,0 +1,167 @@
+import asyncio
+import threading
+
+import pytest
+
+pytest.importorskip('selenium')
+web = pytest.importorskip('aiohttp.web')
+import get_shortname
+
+COOKIES = [{'name': 'd2lSessionVal', 'value': 'sesion-valida'}]
+
+
+class ServidorBrightspace:
+    """Servidor local que sirve páginas de course_offering_info_viewedit.d2l grabadas"""
+
+    def __init__(self):
+        self.peticiones = {}
+        self.fallas = {}        # course_id -> número de respuestas 503 antes de responder bien
+        self.lentos = set()     # course_id que responden después del timeout
+        self.demora = 0.0
+        self.activas = 0
+        self.max_activas = 0
+        self._loop = None
+        self._runner = None
+        self.url = None
+
+    async def pagina(self, request):
+        course_id = request.query['ou']
+        self.peticiones[course_id] = self.peticiones.get(course_id, 0) + 1
+        if request.cookies.get('d2lSessionVal') != 'sesion-valida':
+            raise web.HTTPFound('/d2l/login')
+
+        self.activas += 1
+        self.max_activas = max(self.max_activas, self.activas)
+        try:
+            await asyncio.sleep(1 if course_id in self.lentos else self.demora)
+            if self.peticiones[course_id] <= self.fallas.get(course_id, 0):
+                return web.Response(status=503)
+            if course_id == '4040':
+                return web.Response(status=404)
+            html = f'<html><body><input type="text" id="z_l" value="CUR-X-202610-{course_id}"/></body></html>'
+            return web.Response(text=html, content_type='text/html')
+        finally:
+            self.activas -= 1
+
+    async def login(self, request):
+        return web.Response(text='<html>login</html>', content_type='text/html')
+
+    async def home(self, request):
+        if request.cookies.get('d2lSessionVal') != 'sesion-valida':
+            raise web.HTTPFound('/d2l/login')
+        return web.Response(text='<html>home</html>', content_type='text/html')
+
+    def iniciar(self):
+        listo = threading.Event()
+
+        def ejecutar():
+            self._loop = asyncio.new_event_loop()
+            app = web.Application()
+            app.add_routes([
+                web.get('/d2l/lp/manageCourses/course_offering_info_viewedit.d2l', self.pagina),
+                web.get('/d2l/login', self.login),
+                web.get('/d2l/home', self.home),
+            ])
+            self._runner = web.AppRunner(app)
+            self._loop.run_until_complete(self._runner.setup())
+            sitio = web.TCPSite(self._runner, '127.0.0.1', 0)
+            self._loop.run_until_complete(sitio.start())
+            puerto = self._runner.addresses[0][1]
+            self.url = f'http://127.0.0.1:{puerto}'
+            listo.set()
+            self._loop.run_forever()
+
+        self._hilo = threading.Thread(target=ejecutar, daemon=True)
+        self._hilo.start()
+        listo.wait(5)
+
+    def detener(self):
+        asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self._loop).result(5)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._hilo.join(5)
+
+
+@pytest.fixture
+def servidor(monkeypatch):
+    servidor = ServidorBrightspace()
+    servidor.iniciar()
+    monkeypatch.setattr(get_shortname, 'BASE_URL', servidor.url)
+    monkeypatch.setattr(get_shortname, 'BACKOFF_HTTP', 0.01)
+    monkeypatch.setitem(get_shortname.CONFIG, 'shortname_http_reintentos', 3)
+    monkeypatch.setitem(get_shortname.CONFIG, 'shortname_http_concurrencia', 4)
+    monkeypatch.delitem(get_shortname.CONFIG, 'shortname_api_version', raising=False)
+    yield servidor
+    servidor.detener()
+
+
+def test_resuelve_en_el_orden_de_la_lista(servidor):
+    course_ids = ['1003', '1001', '1002']
+    shortnames, errores = get_shortname.resolve_shortnames_http(COOKIES, course_ids)
+
+    assert list(shortnames.items()) == [(course_id, f'CUR-X-202610-{course_id}') for course_id in course_ids]
+    assert errores == []
+
+
+def test_reintenta_respuestas_503_con_backoff(servidor):
+    servidor.fallas = {'1001': 2, '1002': 10}
+
+    shortnames, errores = get_shortname.resolve_shortnames_http(COOKIES, ['1001', '1002'])
+
+    assert shortnames == {'1001': 'CUR-X-202610-1001'}
+    assert servidor.peticiones['1001'] == 3
+    # 1 intento + shortname_http_reintentos
+    assert servidor.peticiones['1002'] == 4
+    assert [error['course_id'] for error in errores] == ['1002']
+
+
+def test_404_y_login_no_se_reintentan(servidor):
+    shortnames, errores = get_shortname.resolve_shortnames_http(COOKIES, ['4040'])
+    assert shortnames == {} and servidor.peticiones['4040'] == 1
+
+    shortnames, errores = get_shortname.resolve_shortnames_http([{'name': 'd2lSessionVal', 'value': 'vencida'}], ['1001'])
+    assert shortnames == {} and servidor.peticiones['1001'] == 1
+    assert 'Sesión vencida' in errores[0]['error']
+
+
+def test_timeout_por_curso(servidor, monkeypatch):
+    monkeypatch.setattr(get_shortname, 'TIMEOUT_CURSO', 0.3)
+    monkeypatch.setitem(get_shortname.CONFIG, 'shortname_http_reintentos', 1)
+    servidor.lentos = {'1002'}
+
+    shortnames, errores = get_shortname.resolve_shortnames_http(COOKIES, ['1001', '1002', '1003'])
+
+    assert list(shortnames) == ['1001', '1003']
+    assert servidor.peticiones['1002'] == 2
+    assert [error['course_id'] for error in errores] == ['1002']
+
+
+def test_respeta_el_limite_de_concurrencia(servidor, monkeypatch):
+    monkeypatch.setitem(get_shortname.CONFIG, 'shortname_http_concurrencia', 3)
+    servidor.demora = 0.05
+
+    shortnames, _ = get_shortname.resolve_shortnames_http(COOKIES, [str(2000 + i) for i in range(15)])
+
+    assert len(shortnames) == 15
+    assert servidor.max_activas == 3
+
+
+def test_valida_la_sesion_guardada(servidor):
+    assert get_shortname.session_valid_http(COOKIES)
+    assert not get_shortname.session_valid_http([{'name': 'd2lSessionVal', 'value': 'vencida'}])
+
+
+def test_journal_se_escribe_fuera_del_event_loop(servidor, tmp_path, monkeypatch):
+    journal = get_shortname.ShortnameJournal(str(tmp_path / 'journal.jsonl'))
+    hilos = []
+    registrar = journal.record
+
+    def record(*args):
+        hilos.append(threading.current_thread())
+        registrar(*args)
+
+    monkeypatch.setattr(journal, 'record', record)
+    get_shortname.resolve_shortnames_http(COOKIES, ['1001', '4040', '1003'], journal=journal)
+    journal.close()
+
+    assert len(hilos) == 3 and threading.current_thread() not in hilos
+    assert sorted(get_shortname.ShortnameJournal(journal.file_path).load()) == ['1001', '1003']
@@ -0,0 +1,40 @@
+import pytest
+
+pytest.importorskip('selenium')
+import get_shortname
+
+
+def test_pool_registra_cada_curso_en_el_journal(tmp_path):
+    journal = get_shortname.ShortnameJournal(str(tmp_path / 'journal.jsonl'))
+
+    def fetch(session, course_id, error_log):
+        if course_id == '1002':
+            error_log.append({'course_id': course_id, 'url': '', 'error': 'sin z_l'})
+            return None
+        return f'CUR-X-202610-{course_id}'
+
+    get_shortname.resolve_shortnames(['s1', 's2'], ['1001', '1002', '1003'], fetch=fetch, journal=journal)
+    journal.close()
+
+    # Los cursos con error no quedan como resueltos: se reintentan al reanudar
+    assert get_shortname.ShortnameJournal(journal.file_path).load() == {
+        '1001': 'CUR-X-202610-1001', '1003': 'CUR-X-202610-1003'}
+
+
+def test_reanudar_ignora_la_ultima_linea_cortada(tmp_path):
+    ruta = tmp_path / 'journal.jsonl'
+    journal = get_shortname.ShortnameJournal(str(ruta))
+    journal.record('1001', 'CUR-X-202610-1001', [])
+    journal.close()
+    with open(ruta, 'a', encoding='utf-8') as f:
+        f.write('{"course_id": "1002", "shortn')
+
+    assert get_shortname.ShortnameJournal(str(ruta)).load() == {'1001': 'CUR-X-202610-1001'}
+
+
+def test_compactar_elimina_el_journal(tmp_path):
+    ruta = tmp_path / 'journal.jsonl'
+    journal = get_shortname.ShortnameJournal(str(ruta))
+    journal.record('1001', 'CUR-X-202610-1001', [])
+    journal.close(remove=True)
+    assert not ruta.exists()
@@ -0,0 +1,68 @@
+import random
+import threading
+import time
+
+import pytest
+
+pytest.importorskip('selenium')
+import get_shortname
+
+
+def _fetch_simulado(fallidos=()):
+    """fetch(session, course_id, error_log) de prueba: demora aleatoria, registra qué sesión resolvió cada curso"""
+    atendidos = {}
+    lock = threading.Lock()
+
+    def fetch(session, course_id, error_log):
+        time.sleep(random.uniform(0, 0.01))
+        with lock:
+            atendidos[course_id] = session
+        if course_id in fallidos:
+            error_log.append({'course_id': course_id, 'url': f'ou={course_id}', 'error': 'sin z_l'})
+            return None
+        return f'CUR-{session}-202610-{course_id}'
+
+    return fetch, atendidos
+
+
+def test_resultados_y_errores_en_el_orden_de_la_lista():
+    course_ids = [str(10000 + i) for i in range(40)]
+    fallidos = {course_ids[3], course_ids[17], course_ids[31]}
+    fetch, atendidos = _fetch_simulado(fallidos)
+
+    shortnames, errores = get_shortname.resolve_shortnames(['s1', 's2', 's3', 's4'], course_ids, fetch=fetch)
+
+    assert list(shortnames) == [course_id for course_id in course_ids if course_id not in fallidos]
+    assert [error['course_id'] for error in errores] == [course_id for course_id in course_ids if course_id in fallidos]
+    assert all(shortnames[course_id] == f'CUR-{atendidos[course_id]}-202610-{course_id}' for course_id in shortnames)
+    # Cada curso se consulta una sola vez y todas las sesiones participan
+    assert sorted(atendidos) == sorted(course_ids)
+    assert set(atendidos.values()) == {'s1', 's2', 's3', 's4'}
+
+
+def test_una_sesion_a_la_vez_por_worker():
+    en_uso = set()
+    lock = threading.Lock()
+
+    def fetch(session, course_id, error_log):
+        with lock:
+            assert session not in en_uso
+            en_uso.add(session)
+        time.sleep(0.002)
+        with lock:
+            en_uso.remove(session)
+        return f'CUR-X-202610-{course_id}'
+
+    shortnames, errores = get_shortname.resolve_shortnames(['s1', 's2'], [str(i) for i in range(1000, 1020)], fetch=fetch)
+    assert len(shortnames) == 20 and errores == []
+
+
+def test_excepcion_del_fetch_se_propaga():
+    def fetch(session, course_id, error_log):
+        if course_id == '1002':
+            raise RuntimeError('el navegador se cerró')
+        return f'CUR-X-202610-{course_id}'
+
+    with pytest.raises(RuntimeError, match='el navegador se cerró'):
+        get_shortname.resolve_shortnames(['s1', 's2'], ['1001', '1002', '1003'], fetch=fetch)
+
@@ -0,0 +1,59 @@
+import os
+import time
+
+import pytest
+
+pytest.importorskip('selenium')
+import get_shortname
+
+
+class DriverCookies:
+    def __init__(self, cookies):
+        self.cookies = cookies
+
+    def get_cookies(self):
+        return self.cookies
+
+
+def _cookies():
+    ahora = int(time.time())
+    return [
+        {'name': 'd2lSessionVal', 'value': 'secreto-de-sesion'},
+        {'name': 'vencida', 'value': 'x', 'expiry': ahora - 60},
+        {'name': 'vigente', 'value': 'y', 'expiry': ahora + 3600},
+    ]
+
+
+def test_sesion_guardada_descarta_cookies_vencidas(tmp_path):
+    ruta = str(tmp_path / 'sesion.json')
+    get_shortname.save_session(ruta, DriverCookies(_cookies()))
+
+    assert [cookie['name'] for cookie in get_shortname.load_session(ruta, 12)] == ['d2lSessionVal', 'vigente']
+    # Más antigua que max_horas: se ignora
+    assert get_shortname.load_session(ruta, 0) is None
+
+
+@pytest.mark.skipif(os.name == 'nt', reason='los bits de permisos no aplican en Windows')
+def test_sesion_guardada_solo_legible_por_el_usuario(tmp_path):
+    ruta = str(tmp_path / 'sesion.json')
+    get_shortname.save_session(ruta, DriverCookies(_cookies()))
+    assert os.stat(ruta).st_mode & 0o777 == 0o600
+
+
+def test_con_dpapi_las_cookies_no_quedan_en_texto_plano(tmp_path, monkeypatch):
+    # Sustituto reversible de DPAPI para verificar el flujo de cifrado fuera de Windows
+    monkeypatch.setattr(get_shortname, '_USAR_DPAPI', True)
+    monkeypatch.setattr(get_shortname, '_dpapi', lambda data, protect: bytes(b ^ 0x5A for b in data))
+    ruta = str(tmp_path / 'sesion.json')
+
+    get_shortname.save_session(ruta, DriverCookies(_cookies()))
+
+    with open(ruta, 'rb') as f:
+        assert b'secreto-de-sesion' not in f.read()
+    assert get_shortname.load_session(ruta, 12)[0]['value'] == 'secreto-de-sesion'
+
+
+def test_sesion_ilegible_pide_login(tmp_path):
+    ruta = tmp_path / 'sesion.json'
+    ruta.write_bytes(b'\x00\xff no es json')
+    assert get_shortname.load_session(str(ruta), 12) is None
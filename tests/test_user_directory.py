@@ -0,0 +1,30 @@
+import pandas as pd
+
+from helperscomunV2 import UserDirectory
+
+
+def _bd_usuarios(**extra):
+    datos = {
+        'UserName': ['000000001'], 'FirstName': ['Ana'], 'LastName': ['Ruiz'], 'OrgRoleId': ['138'],
+        'OrgDefinedId': ['CC. 123'], 'ExternalEmail': ['ana@upb.edu.co'],
+    }
+    datos.update(extra)
+    return pd.DataFrame(datos)
+
+
+def _sin_cambios(directorio):
+    serie = lambda valor: pd.Series([valor])
+    return directorio.sin_cambios(serie('000000001'), serie('CC. 123'), serie('Ana'), serie('Ruiz'),
+                                  serie('ANA@upb.edu.co'))
+
+
+def test_update_sin_cambios_de_usuario_activo_se_omite():
+    assert _sin_cambios(UserDirectory(_bd_usuarios(IsActive=[1]))).tolist() == [True]
+
+
+def test_usuario_inactivo_recibe_update():
+    assert _sin_cambios(UserDirectory(_bd_usuarios(IsActive=[0]))).tolist() == [False]
+
+
+def test_sin_isactive_no_se_omite_el_update():
+    assert _sin_cambios(UserDirectory(_bd_usuarios())).tolist() == [False]